@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse, Response
+from app.core.admission import admission
+from app.core.config import settings
+from app.core.profiling import profiler, render_collapsed, render_pstats, render_text
+from pydantic import BaseModel
+from typing import Optional
+import hmac
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Check a token against ADMIN_TOKEN; always False while no token is configured."""
+    if not settings.ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), settings.ADMIN_TOKEN.encode("utf-8"))
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Without a configured token the admin API doesn't exist
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+class ProfilingUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = None
+    mode: Optional[str] = None
+    interval_ms: Optional[float] = None
+    ring_size: Optional[int] = None
+
+@router.get("/admin/profiling")
+async def get_profiling():
+    return {
+        "config": profiler.config(),
+        "profiles": profiler.list()
+    }
+
+@router.put("/admin/profiling")
+async def update_profiling(update: ProfilingUpdate):
+    try:
+        profiler.configure(**update.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profiler.config()
+
+@router.get("/admin/profiling/{profile_id}")
+async def download_profile(profile_id: str, format: str = "collapsed"):
+    record = profiler.get(profile_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    if format == "collapsed":
+        return PlainTextResponse(
+            render_collapsed(record),
+            headers={"Content-Disposition": f'attachment; filename="{record.id}.collapsed"'}
+        )
+    if format == "pstats":
+        try:
+            data = render_pstats(record)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return Response(
+            data,
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{record.id}.pstats"'}
+        )
+    if format == "text":
+        return PlainTextResponse(render_text(record))
+    raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+
+@router.get("/admin/admission")
+async def get_admission():
+    return admission.snapshot()
@@ -1,16 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.activity import last_active
+from app.core.admission import admission, AdmissionRejected
+from app.core.database import get_db, SessionLocal
+from app.core.idempotency import idempotency, IdempotencyError, MAX_KEY_LENGTH, request_fingerprint
+from app.core.usage import record_usage
 from app.providers.factory import get_provider
 from app.memory.engine import MemoryEngine
+from app.memory.context import assemble_context
+from app.memory.facts import FactStore
+from app.memory.prompt import prompt_cache, build_memory_block, build_messages
 from app.models.user import User
 from app.models.chat import ChatMessage
 from app.models.memory import Memory
-from pydantic import BaseModel
-from typing import Optional
+from app.utils.helpers import count_tokens
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import time
 import uuid
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 class ChatRequest(BaseModel):
@@ -28,85 +45,116 @@ class ChatResponse(BaseModel):
     timestamp: str
     tokens_used: int
     memory_injected: bool
+    prompt_version: Optional[str] = None
+    cached_tokens: int = 0
+
+class BatchChatRequest(BaseModel):
+    requests: List[ChatRequest] = Field(..., min_length=1, max_length=settings.BATCH_MAX_ITEMS)
+    concurrency: Optional[int] = Field(None, ge=1)
+
+def build_chat_messages(request: ChatRequest, response_data: dict) -> List[ChatMessage]:
+    """Build (but don't persist) the chat rows for one turn."""
+    user_id = request.user_id
+    usage = response_data["usage"]
+    # Both rows of a turn share one timestamp so usage rollups and history agree on the day and order
+    timestamp = datetime.utcnow()
+    chat_message = ChatMessage(
+        user_id=user_id,
+        role="user",
+        content=request.message,
+        timestamp=timestamp
+    )
+    assistant_message = ChatMessage(
+        user_id=user_id,
+        role="assistant",
+        timestamp=timestamp,
+        content=response_data["message"],
+        tokens_used=usage["total_tokens"],
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        completion_tokens=usage.get("completion_tokens", 0),
+        tokens_estimated=usage.get("estimated", False),
+        provider=(request.provider or settings.DEFAULT_PROVIDER).lower(),
+        model=request.model
+    )
+    return [chat_message, assistant_message]
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest, db: Session = Depends(get_db)):
+async def chat_endpoint(
+    request: ChatRequest,
+    response: Response,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None)
+):
+    if not idempotency_key:
+        return await complete_chat(request, response, db)
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+    
+    # Retries and concurrent duplicates with the same key share one provider call and one write
+    async def work():
+        return (await complete_chat(request, response, db)).model_dump()
+    
     try:
-        # Load or create user
-        user = db.query(User).filter(User.user_id == request.user_id).first()
-        if not user:
-            user = User(user_id=request.user_id)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        
-        # Update last active
-        user.last_active = datetime.utcnow()
-        db.commit()
-        
-        # Initialize memory engine
-        memory_engine = MemoryEngine(db)
-        
-        # Retrieve relevant memories
-        relevant_memories = memory_engine.get_relevant_memories(request.user_id, request.message)
-        
-        # Build system prompt with memory
-        system_prompt_parts = []
-        if user.system_prompt:
-            system_prompt_parts.append(user.system_prompt)
-        
-        if user.profile:
-            if user.profile.get('name'):
-                system_prompt_parts.append(f"User name: {user.profile['name']}")
-            if user.profile.get('language'):
-                system_prompt_parts.append(f"Preferred language: {user.profile['language']}")
-            if user.profile.get('custom_instructions'):
-                system_prompt_parts.append(user.profile['custom_instructions'])
-        
-        if relevant_memories:
-            memory_context = "\n".join([mem.content for mem in relevant_memories])
-            system_prompt_parts.append(f"\nRelevant context from previous conversations:\n{memory_context}")
+        body, replayed = await idempotency.run(
+            f"chat:{request.user_id}:{idempotency_key}",
+            request_fingerprint(request.model_dump()),
+            work
+        )
+    except IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return ChatResponse(**body)
+
+async def complete_chat(request: ChatRequest, response: Response, db: Session) -> ChatResponse:
+    try:
+        # Shed bursts before doing any work for them
+        deadline = admission.deadline()
+        await admission.admit(request.user_id)
         
-        system_prompt = "\n".join(system_prompt_parts) if system_prompt_parts else "You are a helpful AI assistant."
+        # Load the user prompt, memories and history concurrently
+        context = await assemble_context(request.user_id, request.message)
         
-        # Prepare messages for the LLM
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": request.message}
-        ]
+        # Stable prompt prefix first, volatile memory context after it
+        started = time.perf_counter()
+        compiled_prompt = context.compiled_prompt
+        memory_block = build_memory_block(context.memories, context.facts)
+        messages = build_messages(compiled_prompt, memory_block, request.message, context.history)
+        context.record("prompt", started)
         
-        # Get response from provider
+        # Get response from provider once the prompt fits the token budget and a slot is free
+        started = time.perf_counter()
         provider = get_provider(request.provider)
-        response_data = await provider.chat_completion(
-            messages=messages,
-            model=request.model,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens
-        )
-        
-        # Save the conversation
-        chat_message = ChatMessage(
-            user_id=request.user_id,
-            role="user",
-            content=request.message
-        )
-        assistant_message = ChatMessage(
-            user_id=request.user_id,
-            role="assistant",
-            content=response_data["message"],
-            tokens_used=response_data["usage"]["total_tokens"]
-        )
-        
-        db.add(chat_message)
-        db.add(assistant_message)
-        db.commit()
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        async with admission.provider_slot(prompt_tokens, deadline):
+            context.record("queue", started)
+            started = time.perf_counter()
+            response_data = await provider.chat_completion(
+                messages=messages,
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens
+            )
+        context.record("provider", started)
+        prompt_cache.record_usage(response_data["usage"])
         
-        # Update memory with the conversation
-        memory_engine.store_conversation_memory(
+        # Save the conversation, its memories and usage rollup in one commit
+        started = time.perf_counter()
+        chat_messages = build_chat_messages(request, response_data)
+        db.add_all(chat_messages)
+        db.add_all(MemoryEngine(db).build_conversation_memories(
             user_id=request.user_id,
             user_message=request.message,
             assistant_response=response_data["message"]
-        )
+        ))
+        FactStore(db).upsert(request.user_id, request.message)
+        record_usage(db, chat_messages)
+        db.commit()
+        context.record("persist", started)
+        
+        response.headers["Server-Timing"] = context.server_timing()
+        logger.debug(f"chat {request.user_id} timings={context.timings} skipped={context.skipped}")
         
         return ChatResponse(
             id=str(uuid.uuid4()),
@@ -114,8 +162,199 @@ async def chat_endpoint(request: ChatRequest, db: Session = Depends(get_db)):
             message=response_data["message"],
             timestamp=datetime.utcnow().isoformat(),
             tokens_used=response_data["usage"]["total_tokens"],
-            memory_injected=len(relevant_memories) > 0
+            memory_injected=len(context.memories) > 0 or len(context.facts) > 0,
+            prompt_version=compiled_prompt.version,
+            cached_tokens=response_data["usage"].get("cached_tokens", 0)
         )
         
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
+
+@router.post("/chat/batch")
+async def chat_batch_endpoint(batch: BatchChatRequest):
+    """Run many chats with bounded concurrency, streaming NDJSON results as they complete.
+    
+    Users and memories for the whole batch are loaded up front, so items for the
+    same user don't see each other's turns. Successful turns are persisted in one
+    write after all items finish, reported by a final summary line. That write
+    still happens if the client disconnects early.
+    """
+    concurrency = min(batch.concurrency or settings.BATCH_CONCURRENCY, settings.BATCH_CONCURRENCY)
+    return StreamingResponse(
+        _run_batch(batch.requests, concurrency),
+        media_type="application/x-ndjson"
+    )
+
+def _load_or_create_users(db: Session, user_ids: List[str]) -> Dict[str, User]:
+    """Load all users in one query, creating the missing ones in one insert."""
+    users = {user.user_id: user for user in db.query(User).filter(User.user_id.in_(user_ids)).all()}
+    missing = [user_id for user_id in user_ids if user_id not in users]
+    if not missing:
+        return users
+    db.add_all([User(user_id=user_id) for user_id in missing])
+    try:
+        db.commit()
+    except IntegrityError:
+        # Some were created concurrently by another request; create the rest one at a time
+        db.rollback()
+        for user_id in missing:
+            if db.query(User).filter(User.user_id == user_id).first() is None:
+                db.add(User(user_id=user_id))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+    return {user.user_id: user for user in db.query(User).filter(User.user_id.in_(user_ids)).all()}
+
+def _persist_batch(turns: List[Tuple[ChatRequest, dict]]) -> int:
+    """Save completed batch turns, their memories, facts and usage in one commit."""
+    db = SessionLocal()
+    try:
+        memory_engine = MemoryEngine(db)
+        fact_store = FactStore(db)
+        chat_records = []
+        for request, response_data in turns:
+            chat_records.extend(build_chat_messages(request, response_data))
+            db.add_all(memory_engine.build_conversation_memories(
+                user_id=request.user_id,
+                user_message=request.message,
+                assistant_response=response_data["message"]
+            ))
+        db.add_all(chat_records)
+        for request, _ in turns:
+            fact_store.upsert(request.user_id, request.message)
+        record_usage(db, chat_records)
+        db.commit()
+        return len(turns)
+    except Exception:
+        db.rollback()
+        logger.exception(f"Failed to persist {len(turns)} batch turns")
+        raise
+    finally:
+        db.close()
+
+# Batch writes outlive a disconnected client, so keep them referenced until they finish
+_batch_writes = set()
+
+async def _finish_batch(completed: List[Tuple[ChatRequest, dict]], outstanding: List[asyncio.Task]) -> int:
+    """Wait for provider calls still in flight, then persist every successful turn."""
+    for result in await asyncio.gather(*outstanding, return_exceptions=True):
+        if isinstance(result, BaseException):
+            continue
+        _, request, response, error = result
+        if error is None:
+            completed.append((request, response[1]))
+    if not completed:
+        return 0
+    return await asyncio.get_running_loop().run_in_executor(None, _persist_batch, completed)
+
+async def _run_batch(requests: List[ChatRequest], concurrency: int):
+    db = SessionLocal()
+    try:
+        user_ids = list({request.user_id for request in requests})
+        
+        # Load or create all users in set-based queries
+        users = _load_or_create_users(db, user_ids)
+        for user_id in user_ids:
+            last_active.touch(user_id)
+        
+        memory_engine = MemoryEngine(db)
+        memories_by_user = memory_engine.get_relevant_memories_for_users(user_ids)
+        fact_store = FactStore(db)
+        queries = {}
+        for request in requests:
+            queries[request.user_id] = queries.get(request.user_id, "") + " " + request.message
+        facts_by_user = fact_store.lookup_many(user_ids, queries)
+        
+        # Build every prompt before fanning out so the workers never touch the session
+        prepared = []
+        for request in requests:
+            relevant_memories = memories_by_user.get(request.user_id, [])
+            facts = facts_by_user.get(request.user_id, [])
+            compiled_prompt = prompt_cache.get(users[request.user_id])
+            messages = build_messages(compiled_prompt, build_memory_block(relevant_memories, facts), request.message)
+            prepared.append((request, messages, compiled_prompt, len(relevant_memories) > 0 or len(facts) > 0))
+        # Give the connection back before the fan-out; results are written by _persist_batch
+        db.close()
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        calling = set()
+        
+        async def run_item(index, request, messages, compiled_prompt, memory_injected):
+            async with semaphore:
+                try:
+                    # Each item counts as a request, paced rather than rejected while it fits the deadline
+                    deadline = admission.deadline()
+                    await admission.admit(request.user_id, settings.ADMISSION_MAX_WAIT)
+                    provider = get_provider(request.provider)
+                    prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+                    async with admission.provider_slot(prompt_tokens, deadline):
+                        calling.add(index)
+                        response_data = await provider.chat_completion(
+                            messages=messages,
+                            model=request.model,
+                            temperature=request.temperature,
+                            max_tokens=request.max_tokens
+                        )
+                except AdmissionRejected as e:
+                    return index, request, None, {"error": str(e), "retry_after": round(e.retry_after, 1)}
+                except Exception as e:
+                    return index, request, None, {"error": f"Chat error: {str(e)}"}
+            prompt_cache.record_usage(response_data["usage"])
+            response = ChatResponse(
+                id=str(uuid.uuid4()),
+                user_id=request.user_id,
+                message=response_data["message"],
+                timestamp=datetime.utcnow().isoformat(),
+                tokens_used=response_data["usage"]["total_tokens"],
+                memory_injected=memory_injected,
+                prompt_version=compiled_prompt.version,
+                cached_tokens=response_data["usage"].get("cached_tokens", 0)
+            )
+            return index, request, (response, response_data), None
+        
+        tasks = [asyncio.create_task(run_item(index, *item)) for index, item in enumerate(prepared)]
+        completed = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, request, result, error = await next_done
+                if error is not None:
+                    yield json.dumps({"index": index, "status": "error", **error}) + "\n"
+                    continue
+                response, response_data = result
+                completed.append((request, response_data))
+                yield json.dumps({"index": index, "status": "ok", "response": response.model_dump()}) + "\n"
+        finally:
+            # Also runs when the client goes away mid-stream. Calls that already reached the
+            # provider are paid for, so they are finished and saved; the rest are dropped.
+            outstanding = []
+            for index, task in enumerate(tasks):
+                if task.done():
+                    continue
+                if index in calling:
+                    outstanding.append(task)
+                else:
+                    task.cancel()
+            persist = asyncio.create_task(_finish_batch(completed, outstanding))
+            _batch_writes.add(persist)
+            persist.add_done_callback(_batch_writes.discard)
+            persist.add_done_callback(lambda done: done.cancelled() or done.exception())
+        
+        # Persist every successful turn in one write
+        summary = {"status": "done", "total": len(requests), "succeeded": len(completed), "failed": len(requests) - len(completed)}
+        try:
+            summary["persisted"] = await asyncio.shield(persist)
+        except Exception as e:
+            summary["persisted"] = 0
+            summary["error"] = f"Persist error: {str(e)}"
+        yield json.dumps(summary) + "\n"
+    except Exception as e:
+        yield json.dumps({"status": "error", "error": f"Batch error: {str(e)}"}) + "\n"
+    finally:
+        db.close()
+
+@router.get("/chat/prompt-cache/stats")
+async def prompt_cache_stats():
+    return prompt_cache.stats()
\ No newline at end of file
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.api.v1.admin import require_admin
+from app.core.database import get_db
+from app.core.usage import query_usage, rebuild_usage_rollups
+from pydantic import BaseModel
+from typing import Optional
+from datetime import date
+
+router = APIRouter()
+
+class ReconcileRequest(BaseModel):
+    user_id: Optional[str] = None
+
+@router.get("/usage")
+async def get_usage(
+    user_id: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    
+    usage = query_usage(db, user_id=user_id, start=start, end=end, provider=provider, model=model)
+    return {
+        "user_id": user_id,
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        **usage
+    }
+
+# Admin only: a full rebuild scans chat_messages, so it runs in the threadpool instead of on the event loop
+@router.post("/usage/reconcile", dependencies=[Depends(require_admin)])
+def reconcile_usage(request: ReconcileRequest, db: Session = Depends(get_db)):
+    rebuilt = rebuild_usage_rollups(db, user_id=request.user_id)
+    return {
+        "status": "success",
+        "user_id": request.user_id,
+        "rollups_rebuilt": rebuilt
+    }
@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.models.user import User
+from app.models.fact import UserFact
+from app.memory.prompt import prompt_cache
 from pydantic import BaseModel
 from typing import Optional
 
@@ -43,24 +45,44 @@ async def update_user_preferences(
         user = User(user_id=user_id)
         db.add(user)
     
-    # Update profile
-    if not user.profile:
-        user.profile = {}
+    # Update profile (reassigned so the JSON column change is detected)
+    profile = dict(user.profile or {})
     
     if preferences.name is not None:
-        user.profile["name"] = preferences.name
+        profile["name"] = preferences.name
     if preferences.language is not None:
-        user.profile["language"] = preferences.language
+        profile["language"] = preferences.language
     if preferences.tone_preference is not None:
-        user.profile["tone_preference"] = preferences.tone_preference
+        profile["tone_preference"] = preferences.tone_preference
     if preferences.custom_instructions is not None:
-        user.profile["custom_instructions"] = preferences.custom_instructions
+        profile["custom_instructions"] = preferences.custom_instructions
+    
+    user.profile = profile
     
     db.commit()
     db.refresh(user)
+    compiled_prompt = prompt_cache.compile(user)
     
     return {
         "user_id": user.user_id,
         "profile": user.profile,
+        "prompt_version": compiled_prompt.version,
         "updated_at": user.updated_at.isoformat() if user.updated_at else None
+    }
+
+@router.get("/user/{user_id}/facts")
+async def get_user_facts(user_id: str, db: Session = Depends(get_db)):
+    facts = db.query(UserFact).filter(UserFact.user_id == user_id).order_by(UserFact.kind, UserFact.key).all()
+    
+    return {
+        "user_id": user_id,
+        "facts": [
+            {
+                "key": fact.key,
+                "value": fact.value,
+                "kind": fact.kind,
+                "updated_at": fact.updated_at.isoformat() if fact.updated_at else None
+            }
+            for fact in facts
+        ]
     }
\ No newline at end of file
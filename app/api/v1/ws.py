@@ -0,0 +1,267 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from collections import deque
+from app.core.activity import last_active
+from app.core.admission import admission, AdmissionRejected
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.usage import record_usage
+from app.api.v1.chat import ChatRequest, build_chat_messages
+from app.memory.context import run_stage
+from app.memory.engine import MemoryEngine
+from app.memory.facts import FactStore
+from app.memory.prompt import CompiledPrompt, prompt_cache, build_memory_block, build_messages
+from app.memory.storage import MemoryRecord
+from app.models.user import User
+from app.providers.factory import get_provider
+from app.utils.helpers import count_tokens
+from datetime import datetime
+from typing import List, Tuple
+import asyncio
+import json
+import uuid
+
+router = APIRouter()
+
+MEMORY_WINDOW = 10
+_STREAM_END = object()
+
+class ChatSession:
+    """Per-connection warm state: the compiled prompt and a window of recent memories.
+    
+    Database work opens a short-lived session per call on the context stage pool, so
+    an idle socket holds no pooled connection and never blocks the event loop.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.compiled_prompt = None
+        self.memories = deque(maxlen=MEMORY_WINDOW)
+
+    async def load(self):
+        """Load or create the user, compile the prompt and fill the memory window."""
+        self.compiled_prompt, records = await run_stage(self._load)
+        self.memories = deque(records, maxlen=MEMORY_WINDOW)
+
+    def _load(self) -> Tuple[CompiledPrompt, List[MemoryRecord]]:
+        db = SessionLocal()
+        try:
+            user = db.query(User).filter(User.user_id == self.user_id).first()
+            if not user:
+                user = User(user_id=self.user_id)
+                db.add(user)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Created concurrently by another request
+                    db.rollback()
+                    user = db.query(User).filter(User.user_id == self.user_id).one()
+            last_active.touch(self.user_id)
+            compiled_prompt = prompt_cache.get(user)
+            records = MemoryEngine(db).get_relevant_memory_records(self.user_id, "", limit=MEMORY_WINDOW)
+            return compiled_prompt, records
+        finally:
+            db.close()
+
+    def ready_frame(self) -> dict:
+        return {
+            "type": "ready",
+            "user_id": self.user_id,
+            "prompt_version": self.compiled_prompt.version,
+            "memories": len(self.memories)
+        }
+
+    def prompt(self):
+        # Preference updates handled by this process land in the shared cache
+        cached = prompt_cache.peek(self.user_id)
+        if cached is not None:
+            self.compiled_prompt = cached
+        return self.compiled_prompt
+
+    async def lookup_facts(self, message: str) -> List[Tuple[str, str]]:
+        return await run_stage(self._lookup_facts, message)
+
+    def _lookup_facts(self, message: str) -> List[Tuple[str, str]]:
+        db = SessionLocal()
+        try:
+            return FactStore(db).lookup(self.user_id, message)
+        finally:
+            db.close()
+
+    async def commit_turn(self, request: ChatRequest, response_data: dict):
+        """Persist one turn and fold its memories into the warm window."""
+        records = await run_stage(self._persist_turn, request, response_data)
+        # Newest first, matching get_relevant_memory_records
+        for record in records:
+            self.memories.appendleft(record)
+
+    def _persist_turn(self, request: ChatRequest, response_data: dict) -> List[MemoryRecord]:
+        db = SessionLocal()
+        try:
+            chat_messages = build_chat_messages(request, response_data)
+            memories = MemoryEngine(db).build_conversation_memories(
+                user_id=self.user_id,
+                user_message=request.message,
+                assistant_response=response_data["message"]
+            )
+            now = datetime.utcnow()
+            records = [
+                MemoryRecord(self.user_id, memory.content, memory.memory_type, memory.created_at or now, memory.relevance_score)
+                for memory in memories
+            ]
+            last_active.touch(self.user_id, now)
+            db.add_all(chat_messages)
+            db.add_all(memories)
+            FactStore(db).upsert(self.user_id, request.message)
+            record_usage(db, chat_messages)
+            db.commit()
+            return records
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+async def _stream_turn(websocket: WebSocket, session: ChatSession, request: ChatRequest) -> dict:
+    """Stream provider tokens to the client through a bounded queue."""
+    # Every turn goes through admission like a /chat request
+    deadline = admission.deadline()
+    await admission.admit(session.user_id)
+    compiled_prompt = session.prompt()
+    # Facts depend on the query, so they are an indexed lookup per turn rather than warm state
+    facts = await session.lookup_facts(request.message)
+    memory_injected = len(session.memories) > 0 or len(facts) > 0
+    messages = build_messages(compiled_prompt, build_memory_block(list(session.memories), facts), request.message)
+    provider = get_provider(request.provider)
+    prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+    
+    # A full queue blocks the provider reader, so a slow client slows the upstream stream
+    queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+    
+    async def produce(slot):
+        try:
+            async for token in provider.stream_completion(
+                messages=messages,
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens
+            ):
+                slot.first_token()
+                await queue.put(token)
+            await queue.put(_STREAM_END)
+        except Exception as e:
+            await queue.put(e)
+    
+    # The slot is held for the whole stream, since the provider call lasts that long, but only
+    # time to first token is observed: the rest is paced by how fast the client reads
+    parts = []
+    async with admission.provider_slot(prompt_tokens, deadline) as slot:
+        producer = asyncio.create_task(produce(slot))
+        try:
+            done = False
+            while not done:
+                item = await queue.get()
+                # Coalesce whatever is already buffered into one frame
+                batch = []
+                while True:
+                    if item is _STREAM_END:
+                        done = True
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    batch.append(item)
+                    if queue.empty():
+                        break
+                    item = queue.get_nowait()
+                if batch:
+                    chunk = "".join(batch)
+                    parts.append(chunk)
+                    await websocket.send_json({"type": "token", "content": chunk})
+        finally:
+            producer.cancel()
+    
+    message = "".join(parts)
+    # Streaming responses carry no usage block, so token counts are estimated
+    completion_tokens = count_tokens(message)
+    response_data = {
+        "message": message,
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "estimated": True
+        }
+    }
+    await session.commit_turn(request, response_data)
+    return {
+        "type": "done",
+        "id": str(uuid.uuid4()),
+        "user_id": session.user_id,
+        "message": message,
+        "timestamp": datetime.utcnow().isoformat(),
+        "tokens_used": response_data["usage"]["total_tokens"],
+        "tokens_estimated": True,
+        "memory_injected": memory_injected,
+        "prompt_version": compiled_prompt.version
+    }
+
+@router.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket, user_id: str):
+    """Persistent chat session.
+    
+    Client frames: {"type": "chat", "message": ..., "provider"/"model"/"temperature"/"max_tokens"},
+    {"type": "ping"} and {"type": "refresh"} (reload profile, prompt and memories).
+    Server frames: "ready", "token", "done", "error", "ping" and "pong".
+    """
+    await websocket.accept()
+    session = ChatSession(user_id)
+    try:
+        await session.load()
+        await websocket.send_json(session.ready_frame())
+        
+        missed = 0
+        while True:
+            try:
+                raw = await asyncio.wait_for(websocket.receive_text(), timeout=settings.WS_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                missed += 1
+                if missed >= settings.WS_MAX_MISSED_HEARTBEATS:
+                    await websocket.close(code=1001)
+                    return
+                await websocket.send_json({"type": "ping"})
+                continue
+            missed = 0
+            
+            try:
+                payload = json.loads(raw)
+            except ValueError:
+                await websocket.send_json({"type": "error", "error": "Invalid JSON"})
+                continue
+            
+            kind = payload.get("type", "chat") if isinstance(payload, dict) else None
+            if kind == "ping":
+                await websocket.send_json({"type": "pong"})
+            elif kind == "pong":
+                continue
+            elif kind == "refresh":
+                await session.load()
+                await websocket.send_json(session.ready_frame())
+            elif kind == "chat":
+                try:
+                    request = ChatRequest(user_id=user_id, **{k: v for k, v in payload.items() if k not in ("type", "user_id")})
+                except ValidationError as e:
+                    await websocket.send_json({"type": "error", "error": f"Invalid request: {e.errors()}"})
+                    continue
+                try:
+                    await websocket.send_json(await _stream_turn(websocket, session, request))
+                except WebSocketDisconnect:
+                    raise
+                except AdmissionRejected as e:
+                    await websocket.send_json({"type": "error", "error": str(e), "retry_after": round(e.retry_after, 1)})
+                except Exception as e:
+                    await websocket.send_json({"type": "error", "error": f"Chat error: {str(e)}"})
+            else:
+                await websocket.send_json({"type": "error", "error": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,60 @@
+from sqlalchemy import bindparam, update
+from app.core.database import SessionLocal
+from app.models.user import User
+from datetime import datetime
+from typing import Optional
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class LastActiveTracker:
+    """Coalesces User.last_active touches into one periodic bulk UPDATE."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def touch(self, user_id: str, when: Optional[datetime] = None):
+        with self._lock:
+            self._pending[user_id] = when or datetime.utcnow()
+
+    def flush(self) -> int:
+        """Write all pending touches. Returns the number of users updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        
+        users = User.__table__
+        stmt = update(users).where(users.c.user_id == bindparam("b_user_id")).values(
+            last_active=bindparam("b_last_active")
+        )
+        db = SessionLocal()
+        try:
+            db.connection().execute(stmt, [
+                {"b_user_id": user_id, "b_last_active": when} for user_id, when in pending.items()
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put the touches back unless a newer one arrived meanwhile
+            with self._lock:
+                for user_id, when in pending.items():
+                    self._pending.setdefault(user_id, when)
+            raise
+        finally:
+            db.close()
+        return len(pending)
+
+    async def run(self, interval: float):
+        """Flush periodically until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.warning(f"last_active flush failed: {e}")
+
+last_active = LastActiveTracker()
@@ -0,0 +1,364 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from app.core.config import settings
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("memory", "redis")
+MAX_LOCAL_BUCKETS = 10000
+
+# (key, rate per second, capacity, amount)
+BucketSpec = Tuple[str, float, float, float]
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Server busy ({reason}), retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+def is_overload(error: BaseException) -> bool:
+    """Whether a failed provider call points at congestion (timeouts, 429s, 5xx).
+
+    Errors the request brought on itself, like an unknown model or a bad max_tokens,
+    say nothing about provider capacity.
+    """
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    return bool(getattr(error, "overloaded", False))
+
+class ProviderSlot:
+    """Handle for a held provider slot.
+
+    Streams call first_token() so only time to first token feeds the limiter; the
+    rest of a stream moves at the client's pace, not the provider's.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+
+    def latency(self) -> float:
+        return (self.first_token_at or time.monotonic()) - self.started
+
+class LocalBuckets:
+    """Token buckets for this process.
+
+    A take either reserves from every bucket or from none. Amounts that can't be
+    covered yet may still be reserved when the shortfall refills within max_wait;
+    the balance goes negative and the caller sleeps off the returned wait.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, List[float]] = {}
+
+    def _level(self, key: str, rate: float, capacity: float, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return capacity
+        tokens, updated = bucket[0], bucket[1]
+        return min(capacity, tokens + (now - updated) * rate)
+
+    def _prune(self, now: float):
+        # Buckets that have refilled behave exactly like missing ones
+        for key, (tokens, updated, rate, capacity) in list(self._buckets.items()):
+            if tokens + (now - updated) * rate >= capacity:
+                del self._buckets[key]
+
+    async def take(self, specs: List[BucketSpec], max_wait: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        levels = []
+        wait = 0.0
+        for key, rate, capacity, amount in specs:
+            level = self._level(key, rate, capacity, now)
+            levels.append(level)
+            if level < amount:
+                wait = max(wait, (amount - level) / rate)
+        if wait > max_wait:
+            return False, wait
+
+        for (key, rate, capacity, amount), level in zip(specs, levels):
+            self._buckets[key] = [level - amount, now, rate, capacity]
+        if len(self._buckets) > MAX_LOCAL_BUCKETS:
+            self._prune(now)
+        return True, wait
+
+# Same all-or-nothing take as LocalBuckets, run atomically on the Redis server clock
+TAKE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local max_wait = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local capacity = tonumber(ARGV[i * 3])
+    local amount = tonumber(ARGV[i * 3 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = capacity
+    if state[1] then
+        level = math.min(capacity, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+    end
+    levels[i] = level
+    if level < amount then
+        wait = math.max(wait, (amount - level) / rate)
+    end
+end
+if wait > max_wait then
+    return {0, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local capacity = tonumber(ARGV[i * 3])
+    local amount = tonumber(ARGV[i * 3 + 1])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - amount), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil((capacity + amount) / rate * 1000) + 1000)
+end
+return {1, tostring(wait)}
+"""
+
+class RedisBuckets:
+    """Token buckets shared by every worker through Redis."""
+
+    def __init__(self, url: str, prefix: str = "memorai:admission:"):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+
+    async def take(self, specs: List[BucketSpec], max_wait: float) -> Tuple[bool, float]:
+        args = [max_wait]
+        for _, rate, capacity, amount in specs:
+            args.extend([rate, capacity, amount])
+        granted, wait = await self._take(keys=[self.prefix + spec[0] for spec in specs], args=args)
+        return bool(granted), float(wait)
+
+def create_buckets():
+    backend = settings.ADMISSION_BACKEND.lower()
+    if backend == "redis":
+        return RedisBuckets(settings.REDIS_URL)
+    if backend == "memory":
+        return LocalBuckets()
+    raise ValueError(f"Unknown admission backend: {settings.ADMISSION_BACKEND} (expected one of {BACKENDS})")
+
+class AdaptiveLimit:
+    """Concurrency limit that follows provider latency (additive increase, multiplicative decrease).
+
+    The baseline tracks the best recent latency. While smoothed latency stays within
+    ADMISSION_LATENCY_TOLERANCE of it and the limit is in use, the limit grows by about
+    one per round trip; once latency rises past it, or calls fail, the limit shrinks
+    by 10%, at most once per smoothed round trip.
+    """
+
+    def __init__(self, minimum: int, maximum: int, initial: int, tolerance: float):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.limit = float(max(minimum, min(maximum, initial)))
+        self.baseline: Optional[float] = None
+        self.smoothed: Optional[float] = None
+        self._last_decrease = 0.0
+
+    def observe(self, latency: float, in_flight: int, ok: bool = True):
+        if ok:
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                # Drift up slowly so a permanently slower model becomes the new normal
+                self.baseline += (latency - self.baseline) * 0.01
+            self.smoothed = latency if self.smoothed is None else self.smoothed * 0.8 + latency * 0.2
+
+        now = time.monotonic()
+        if not ok or self.smoothed > self.baseline * self.tolerance:
+            if now - self._last_decrease >= (self.smoothed or 0.0):
+                self.limit = max(self.minimum, self.limit * 0.9)
+                self._last_decrease = now
+        elif in_flight + 1 >= self.limit:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def expected_wait(self, queued: int) -> float:
+        """Rough time until a request queued behind `queued` others gets a slot."""
+        return (queued + 1) * (self.smoothed or 1.0) / max(1.0, self.limit)
+
+class AdmissionController:
+    """Sheds load before it piles up behind the provider and the database.
+
+    Per-user and global request buckets reject bursts up front. After the prompt is
+    built, the provider call waits in a bounded queue for a slot under the adaptive
+    concurrency limit, then takes its estimated tokens from a global token bucket.
+    A request is rejected with a Retry-After hint as soon as it's clear it can't
+    start before its deadline. Buckets can live in Redis; the queue and limit are
+    per process since they follow this worker's own in-flight calls.
+    """
+
+    def __init__(self, buckets=None):
+        self._buckets = buckets
+        self.limiter = AdaptiveLimit(
+            settings.ADMISSION_MIN_CONCURRENCY,
+            settings.ADMISSION_MAX_CONCURRENCY,
+            settings.ADMISSION_INITIAL_CONCURRENCY,
+            settings.ADMISSION_LATENCY_TOLERANCE
+        )
+        self.in_flight = 0
+        self._waiters = deque()
+        self.stats = {"admitted": 0, "rejected": {}}
+
+    @property
+    def buckets(self):
+        if self._buckets is None:
+            self._buckets = create_buckets()
+        return self._buckets
+
+    def deadline(self) -> float:
+        return time.monotonic() + settings.ADMISSION_MAX_WAIT
+
+    def _reject(self, reason: str, retry_after: float) -> AdmissionRejected:
+        self.stats["rejected"][reason] = self.stats["rejected"].get(reason, 0) + 1
+        return AdmissionRejected(reason, retry_after)
+
+    def _deadline_rejection(self, deadline: float, expected: float) -> AdmissionRejected:
+        """Reject a request that can't get a slot in time, hinting by what used up its budget.
+
+        When most of the budget went before the queue (context assembly, database waits),
+        a retry would spend it again, so it's told to back off for that long rather than
+        for the much shorter queue estimate.
+        """
+        spent = settings.ADMISSION_MAX_WAIT - (deadline - time.monotonic())
+        if spent > expected:
+            return self._reject("budget_spent", spent)
+        return self._reject("deadline", expected)
+
+    async def _take(self, specs: List[BucketSpec], max_wait: float) -> Tuple[bool, float]:
+        specs = [spec for spec in specs if spec[1] > 0]
+        if not specs:
+            return True, 0.0
+        # A single take larger than a bucket could never fit, so cap it at the capacity
+        specs = [(key, rate, capacity, min(amount, capacity)) for key, rate, capacity, amount in specs]
+        try:
+            return await self.buckets.take(specs, max_wait)
+        except Exception as e:
+            # A broken bucket store shouldn't turn into an outage; admit and log
+            logger.warning(f"Admission buckets unavailable, admitting unchecked: {e}")
+            return True, 0.0
+
+    async def admit(self, user_id: str, max_wait: float = 0.0):
+        """Charge one request to the user and global request buckets, or reject.
+
+        Interactive requests are rejected as soon as a bucket is empty; batch items
+        pass a max_wait and are paced until the buckets refill.
+        """
+        if not settings.ADMISSION_ENABLED:
+            return
+        specs = [
+            (f"user:{user_id}", settings.ADMISSION_USER_RPS, settings.ADMISSION_USER_BURST, 1),
+            ("global:requests", settings.ADMISSION_GLOBAL_RPS, settings.ADMISSION_GLOBAL_BURST, 1),
+        ]
+        granted, wait = await self._take(specs, max_wait)
+        if not granted:
+            raise self._reject("rate_limit", wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def provider_slot(self, prompt_tokens: int, deadline: float):
+        """Hold a provider slot for the estimated prompt, observing the call's latency.
+
+        Only successes and overload failures are observed; other errors and cancelled
+        callers just release the slot.
+        """
+        if not settings.ADMISSION_ENABLED:
+            yield ProviderSlot()
+            return
+
+        # Tokens are only taken once a slot is granted, so queue rejections don't burn budget
+        await self._acquire(deadline)
+        try:
+            spec = ("global:tokens", settings.ADMISSION_GLOBAL_TOKENS_PER_SEC, settings.ADMISSION_GLOBAL_TOKEN_BURST, prompt_tokens)
+            granted, wait = await self._take([spec], max(0.0, deadline - time.monotonic()))
+            if not granted:
+                raise self._reject("token_budget", wait)
+            if wait > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._release()
+            raise
+        self.stats["admitted"] += 1
+        slot = ProviderSlot()
+        try:
+            yield slot
+        except BaseException as e:
+            if is_overload(e):
+                self.limiter.observe(slot.latency(), self.in_flight - 1, ok=False)
+            raise
+        else:
+            self.limiter.observe(slot.latency(), self.in_flight - 1)
+        finally:
+            self._release()
+
+    async def _acquire(self, deadline: float):
+        if self.in_flight < int(self.limiter.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+
+        expected = self.limiter.expected_wait(len(self._waiters))
+        if len(self._waiters) >= settings.ADMISSION_QUEUE_SIZE:
+            raise self._reject("queue_full", expected)
+        remaining = deadline - time.monotonic()
+        if expected > remaining:
+            raise self._deadline_rejection(deadline, expected)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), remaining)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                # The queue moved slower than estimated, so don't promise less than it took
+                raise self._reject("deadline", max(remaining, self.limiter.expected_wait(len(self._waiters))))
+        except BaseException:
+            # The slot may have been handed over just as the caller went away
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                waiter.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        # Hand freed slots straight to queued requests, oldest first
+        while self._waiters and self.in_flight < int(self.limiter.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": settings.ADMISSION_ENABLED,
+            "backend": settings.ADMISSION_BACKEND,
+            "limit": round(self.limiter.limit, 2),
+            "baseline_latency_ms": round(self.limiter.baseline * 1000, 1) if self.limiter.baseline else None,
+            "smoothed_latency_ms": round(self.limiter.smoothed * 1000, 1) if self.limiter.smoothed else None,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.stats["admitted"],
+            "rejected": dict(self.stats["rejected"]),
+        }
+
+admission = AdmissionController()
@@ -2,14 +2,19 @@ from pydantic_settings import BaseSettings
 from typing import Optional
 
 class Settings(BaseSettings):
-    # API Keys
-    OPENAI_API_KEY: str
+    # API Keys (validated by each provider on first use, not at import time)
+    OPENAI_API_KEY: Optional[str] = None
     QWEN_API_KEY: Optional[str] = None
     DEEPSEEK_API_KEY: Optional[str] = None
     
     # Database
     DATABASE_URL: str = "sqlite:///./memorai.db"
     
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    SQLITE_BUSY_TIMEOUT: float = 30.0
+    
     # Redis (optional)
     REDIS_URL: Optional[str] = "redis://localhost:6379"
     
@@ -19,10 +24,70 @@ class Settings(BaseSettings):
     MEMORY_RETENTION_DAYS: int = 30
     LOG_LEVEL: str = "INFO"
     
+    # Context assembly
+    CONTEXT_RETRIEVAL_DEADLINE_MS: float = 250.0
+    CONTEXT_HISTORY_TURNS: int = 0
+    CONTEXT_STAGE_WORKERS: int = 8  # keep at or below DB_POOL_SIZE so stages never wait on the pool
+    LAST_ACTIVE_FLUSH_INTERVAL: float = 5.0
+    
+    # Keyword memory index (snapshotted to mmap-able segment files)
+    MEMORY_INDEX_ENABLED: bool = False
+    MEMORY_INDEX_DIR: str = "./data/index"
+    MEMORY_INDEX_SHARDS: int = 16
+    MEMORY_INDEX_REFRESH_INTERVAL: float = 5.0
+    MEMORY_INDEX_SNAPSHOT_INTERVAL: float = 300.0
+    MEMORY_INDEX_HITS: int = 5
+    
+    # Idempotency-Key handling for /chat
+    IDEMPOTENCY_BACKEND: str = "memory"  # memory, redis
+    IDEMPOTENCY_TTL: float = 86400.0
+    IDEMPOTENCY_LOCK_TTL: float = 120.0
+    IDEMPOTENCY_MAX_ENTRIES: int = 10000
+    
+    # Admission control for /chat (a rate or burst of 0 disables that bucket)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_BACKEND: str = "memory"  # memory, redis
+    ADMISSION_USER_RPS: float = 2.0
+    ADMISSION_USER_BURST: float = 10.0
+    ADMISSION_GLOBAL_RPS: float = 50.0
+    ADMISSION_GLOBAL_BURST: float = 100.0
+    ADMISSION_GLOBAL_TOKENS_PER_SEC: float = 0.0
+    ADMISSION_GLOBAL_TOKEN_BURST: float = 0.0
+    ADMISSION_MIN_CONCURRENCY: int = 4
+    ADMISSION_MAX_CONCURRENCY: int = 64
+    ADMISSION_INITIAL_CONCURRENCY: int = 16
+    ADMISSION_LATENCY_TOLERANCE: float = 2.0
+    ADMISSION_QUEUE_SIZE: int = 100
+    ADMISSION_MAX_WAIT: float = 5.0
+    
+    # Batch chat
+    BATCH_MAX_ITEMS: int = 1000
+    BATCH_CONCURRENCY: int = 8
+    
+    # WebSocket chat
+    WS_HEARTBEAT_INTERVAL: float = 20.0
+    WS_MAX_MISSED_HEARTBEATS: int = 3
+    WS_SEND_QUEUE_SIZE: int = 64
+    
+    # Startup
+    INIT_DB_ON_STARTUP: bool = True
+    PREWARM_ON_STARTUP: bool = True
+    
+    # Profiling
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_MODE: str = "sampling"  # sampling, cprofile
+    PROFILING_INTERVAL_MS: float = 5.0
+    PROFILING_RING_SIZE: int = 50
+    PROFILING_HEADER: str = "X-Debug-Profile"
+    
+    # Admin endpoints (/api/v1/admin/*) and the profiling debug header stay disabled until a token is set
+    ADMIN_TOKEN: Optional[str] = None
+    
     # CORS
     ALLOWED_ORIGINS: str = "*"
     
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
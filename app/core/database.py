@@ -1,19 +1,83 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+import logging
 import os
+import threading
 
-# Create database directory if it doesn't exist
-db_path = settings.DATABASE_URL.replace("sqlite:///", "")
-db_dir = os.path.dirname(db_path)
-if db_dir and not os.path.exists(db_dir):
-    os.makedirs(db_dir, exist_ok=True)
+logger = logging.getLogger(__name__)
 
-engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Create the database engine on first use and bind the session factory to it."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                sqlite = settings.DATABASE_URL.startswith("sqlite")
+                in_memory = sqlite and ":memory:" in settings.DATABASE_URL
+                if sqlite:
+                    # Create database directory if it doesn't exist
+                    db_path = settings.DATABASE_URL.replace("sqlite:///", "")
+                    db_dir = os.path.dirname(db_path)
+                    if db_dir and not os.path.exists(db_dir):
+                        os.makedirs(db_dir, exist_ok=True)
+                    connect_args = {"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT}
+                else:
+                    connect_args = {}
+                
+                # Context stages each hold a connection, so size the pool instead of relying on defaults
+                pool_args = {}
+                if not in_memory:
+                    pool_args = {
+                        "pool_size": settings.DB_POOL_SIZE,
+                        "max_overflow": settings.DB_MAX_OVERFLOW,
+                        "pool_timeout": settings.DB_POOL_TIMEOUT,
+                    }
+                engine = create_engine(settings.DATABASE_URL, connect_args=connect_args, **pool_args)
+                if sqlite and not in_memory:
+                    event.listen(engine, "connect", _configure_sqlite)
+                _session_factory.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets the concurrent read stages run alongside a writer instead of failing with "database is locked"
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT * 1000)}")
+    cursor.close()
+
+def SessionLocal(**kwargs):
+    """Open a session, creating the engine first so no caller can get an unbound one."""
+    get_engine()
+    return _session_factory(**kwargs)
+
+def __getattr__(name):
+    # Keep `from app.core.database import engine` working without creating it at import time
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def dialect_insert(db, model):
+    """INSERT supporting on_conflict_do_update, or None on dialects without it."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert(model)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -22,9 +86,61 @@ def get_db():
         db.close()
 
 def init_db():
-    """Initialize the database by creating all tables."""
+    """Initialize the database by creating all missing tables and columns."""
     from app.models.user import User
     from app.models.memory import Memory
     from app.models.chat import ChatMessage
+    from app.models.usage import UsageRollup
+    from app.models.fact import UserFact
+    engine = get_engine()
     Base.metadata.create_all(bind=engine)
-    print("Database initialized successfully!")
\ No newline at end of file
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+    logger.info("Database initialized successfully!")
+
+def _column_names(engine, table_name: str) -> set:
+    return {column["name"] for column in inspect(engine).get_columns(table_name)}
+
+def add_missing_columns(engine):
+    """Add model columns missing from existing tables (create_all only creates new tables)."""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = _column_names(engine, table.name)
+        for column in table.columns:
+            if column.name in existing or column.primary_key:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            # One transaction per column: another worker starting at the same time may add it first
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+                logger.info(f"Added column {table.name}.{column.name}")
+            except DBAPIError:
+                if column.name not in _column_names(engine, table.name):
+                    raise
+                logger.info(f"Column {table.name}.{column.name} was added by another worker")
+
+def add_missing_indexes(engine):
+    """Create model indexes missing from existing tables."""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=engine)
+                logger.info(f"Created index {index.name}")
+            except DBAPIError:
+                if index.name not in {i["name"] for i in inspect(engine).get_indexes(table.name)}:
+                    raise
+                logger.info(f"Index {index.name} was created by another worker")
+
+def prewarm_pool():
+    """Open a pooled connection so the first request doesn't pay the connect cost."""
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
@@ -0,0 +1,190 @@
+from collections import OrderedDict
+from app.core.config import settings
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("memory", "redis")
+MAX_KEY_LENGTH = 255  # Idempotency-Key header, before the user scope is added
+POLL_INTERVAL = 0.1
+
+class IdempotencyError(Exception):
+    status_code = 400
+
+class IdempotencyKeyReused(IdempotencyError):
+    status_code = 422
+
+class IdempotencyConflict(IdempotencyError):
+    status_code = 409
+
+def request_fingerprint(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class MemoryIdempotencyStore:
+    """Per-process TTL store for completed responses and in-progress claims."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._records = OrderedDict()
+        self._claims = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        # Every record gets the same TTL, so the oldest insert expires first
+        while self._records:
+            key, (expires_at, _) = next(iter(self._records.items()))
+            if expires_at > now and len(self._records) <= self.max_entries:
+                break
+            self._records.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is None or entry[0] <= now:
+                return None
+            return entry[1]
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self._claims.get(key, 0) > now:
+                return False
+            self._claims[key] = now + ttl
+            return True
+
+    async def release(self, key: str):
+        with self._lock:
+            self._claims.pop(key, None)
+
+    async def put(self, key: str, record: Dict[str, Any], ttl: float):
+        now = time.monotonic()
+        with self._lock:
+            self._records[key] = (now + ttl, record)
+            self._records.move_to_end(key)
+            self._claims.pop(key, None)
+            self._prune(now)
+
+class RedisIdempotencyStore:
+    """Shared TTL store so retries landing on another worker are still replayed."""
+
+    def __init__(self, url: str, prefix: str = "memorai:idempotency:"):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        return bool(await self.client.set(self.prefix + key + ":lock", "1", nx=True, px=int(ttl * 1000)))
+
+    async def release(self, key: str):
+        await self.client.delete(self.prefix + key + ":lock")
+
+    async def put(self, key: str, record: Dict[str, Any], ttl: float):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(self.prefix + key, json.dumps(record), px=int(ttl * 1000))
+            pipe.delete(self.prefix + key + ":lock")
+            await pipe.execute()
+
+def create_store():
+    backend = settings.IDEMPOTENCY_BACKEND.lower()
+    if backend == "redis":
+        return RedisIdempotencyStore(settings.REDIS_URL)
+    if backend == "memory":
+        return MemoryIdempotencyStore(settings.IDEMPOTENCY_MAX_ENTRIES)
+    raise ValueError(f"Unknown idempotency backend: {settings.IDEMPOTENCY_BACKEND} (expected one of {BACKENDS})")
+
+class IdempotencyManager:
+    """Runs each idempotency key's work once.
+
+    Concurrent duplicates in this process attach to the in-flight task; duplicates
+    in other processes wait on the store's claim; later retries are replayed from
+    the store until the TTL runs out. Failures aren't stored, so a retry can
+    succeed after an error.
+    """
+
+    def __init__(self, store=None):
+        self._store = store
+        self._inflight: Dict[str, Tuple[str, asyncio.Task]] = {}
+        self.stats = {"executed": 0, "coalesced": 0, "replayed": 0}
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = create_store()
+        return self._store
+
+    async def run(self, key: str, fingerprint: str, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (response, replayed) for a key, running work at most once."""
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            if inflight[0] != fingerprint:
+                raise IdempotencyKeyReused("Idempotency-Key was already used for a different request")
+            self.stats["coalesced"] += 1
+            response, _ = await asyncio.shield(inflight[1])
+            return response, True
+
+        # Work runs in its own task so a cancelled caller doesn't cancel it for the others
+        task = asyncio.create_task(self._execute(key, fingerprint, work))
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._inflight[key] = (fingerprint, task)
+        return await asyncio.shield(task)
+
+    async def _claim(self, key: str, fingerprint: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Return (stored record, claimed), waiting while another process holds the key."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.IDEMPOTENCY_LOCK_TTL
+        while True:
+            record = await self.store.get(key)
+            if record is not None:
+                if record["fingerprint"] != fingerprint:
+                    raise IdempotencyKeyReused("Idempotency-Key was already used for a different request")
+                return record, False
+            if await self.store.claim(key, settings.IDEMPOTENCY_LOCK_TTL):
+                return None, True
+            if loop.time() >= deadline:
+                raise IdempotencyConflict("A request with this Idempotency-Key is still in progress")
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _execute(self, key: str, fingerprint: str, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        try:
+            try:
+                record, claimed = await self._claim(key, fingerprint)
+            except IdempotencyError:
+                raise
+            except Exception as e:
+                # An unreachable store shouldn't take /chat down with it; run without dedup
+                logger.warning(f"Idempotency store unavailable, running {key} unguarded: {e}")
+                record, claimed = None, False
+            if record is not None:
+                self.stats["replayed"] += 1
+                return record["response"], True
+
+            try:
+                response = await work()
+            except BaseException:
+                if claimed:
+                    try:
+                        await self.store.release(key)
+                    except Exception as e:
+                        logger.warning(f"Failed to release idempotency claim for {key}: {e}")
+                raise
+            self.stats["executed"] += 1
+            try:
+                await self.store.put(key, {"fingerprint": fingerprint, "response": response}, settings.IDEMPOTENCY_TTL)
+            except Exception as e:
+                logger.warning(f"Failed to store idempotent response for {key}: {e}")
+            return response, False
+        finally:
+            self._inflight.pop(key, None)
+
+idempotency = IdempotencyManager()
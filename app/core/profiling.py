@@ -0,0 +1,285 @@
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from app.core.config import settings
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import cProfile
+import functools
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+
+MODES = ("sampling", "cprofile")
+
+class ProfileRecord:
+    __slots__ = ("id", "method", "path", "mode", "started_at", "duration_ms", "samples", "data")
+
+    def __init__(self, method: str, path: str, mode: str, duration_ms: float, samples: int, data: Any):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.mode = mode
+        self.started_at = datetime.utcnow()
+        self.duration_ms = duration_ms
+        self.samples = samples
+        self.data = data
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "mode": self.mode,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 3),
+            "samples": self.samples,
+        }
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler:
+    """Samples the request thread's stack, plus any worker threads attached to it, on a background thread."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.workers: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memorai-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            threads = [(self.thread_id, None)] + list(self.workers.items())
+            for thread_id, root in threads:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                # Worker stacks get their own root so they don't merge into the event loop's
+                if root is not None:
+                    stack.append(root)
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+class _ActiveProfile:
+    """State of the running profile, shared with the worker threads it covers."""
+
+    def __init__(self, mode: str, profiler, started: float):
+        self.mode = mode
+        self.profiler = profiler
+        self.started = started
+        self.thread_profiles: List[cProfile.Profile] = []
+        self.stopped = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def thread(self, name: str):
+        """Include the calling worker thread in this profile while the block runs."""
+        if self.mode == "sampling":
+            thread_id = threading.get_ident()
+            self.profiler.workers[thread_id] = f"[thread] {name}"
+            try:
+                yield
+            finally:
+                self.profiler.workers.pop(thread_id, None)
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler already owns this thread
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                if not self.stopped:
+                    self.thread_profiles.append(profile)
+
+_current_profile: ContextVar[Optional[_ActiveProfile]] = ContextVar("memorai_profile", default=None)
+
+def profile_thread(func):
+    """Include a function run through asyncio.to_thread in the calling request's profile.
+    
+    to_thread copies the request's context into the worker, so the active profile
+    is visible there.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        active = _current_profile.get()
+        if active is None:
+            return func(*args, **kwargs)
+        with active.thread(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+class Profiler:
+    """Runtime-togglable request profiler with a bounded ring of results.
+    
+    Only one request is profiled at a time. Both modes observe the whole
+    event-loop thread, so concurrent requests can show up in a profile, plus
+    the worker threads that run the profiled request's profile_thread stages.
+    """
+
+    def __init__(self):
+        self.enabled = settings.PROFILING_ENABLED
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.mode = settings.PROFILING_MODE
+        self.interval_ms = settings.PROFILING_INTERVAL_MS
+        self.records = deque(maxlen=settings.PROFILING_RING_SIZE)
+        self._active = threading.Lock()
+
+    def configure(self, enabled: Optional[bool] = None, sample_rate: Optional[float] = None,
+                  mode: Optional[str] = None, interval_ms: Optional[float] = None,
+                  ring_size: Optional[int] = None):
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"Unsupported profiling mode: {mode}")
+        if enabled is not None:
+            self.enabled = enabled
+        if sample_rate is not None:
+            self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        if mode is not None:
+            self.mode = mode
+        if interval_ms is not None:
+            self.interval_ms = max(interval_ms, 0.1)
+        if ring_size is not None and ring_size != self.records.maxlen:
+            self.records = deque(self.records, maxlen=max(ring_size, 1))
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "mode": self.mode,
+            "interval_ms": self.interval_ms,
+            "ring_size": self.records.maxlen,
+            "stored": len(self.records),
+        }
+
+    def should_profile(self, forced: bool) -> bool:
+        if not self.enabled:
+            return False
+        return forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self):
+        """Start profiling the current thread; returns a handle or None if another profile is running."""
+        if not self._active.acquire(blocking=False):
+            return None
+        try:
+            if self.mode == "cprofile":
+                profile = cProfile.Profile()
+                profile.enable()
+                active = _ActiveProfile("cprofile", profile, time.perf_counter())
+            else:
+                sampler = StackSampler(threading.get_ident(), self.interval_ms / 1000)
+                sampler.start()
+                active = _ActiveProfile("sampling", sampler, time.perf_counter())
+            # Tasks and to_thread workers started for this request inherit it
+            _current_profile.set(active)
+            return active
+        except Exception:
+            self._active.release()
+            raise
+
+    def stop(self, handle: _ActiveProfile, method: str, path: str) -> ProfileRecord:
+        mode, profiler, started = handle.mode, handle.profiler, handle.started
+        try:
+            _current_profile.set(None)
+            if mode == "cprofile":
+                profiler.disable()
+                duration_ms = (time.perf_counter() - started) * 1000
+                with handle._lock:
+                    handle.stopped = True
+                    thread_profiles = list(handle.thread_profiles)
+                # Merge the worker threads' stats into the event loop's
+                stats = pstats.Stats(profiler)
+                for profile in thread_profiles:
+                    stats.add(profile)
+                record = ProfileRecord(method, path, mode, duration_ms, len(stats.stats), stats.stats)
+            else:
+                stacks = profiler.stop()
+                duration_ms = (time.perf_counter() - started) * 1000
+                record = ProfileRecord(method, path, mode, duration_ms, sum(stacks.values()), stacks)
+        finally:
+            self._active.release()
+        self.records.append(record)
+        return record
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [record.summary() for record in reversed(self.records)]
+
+    def get(self, profile_id: str) -> Optional[ProfileRecord]:
+        for record in self.records:
+            if record.id == profile_id:
+                return record
+        return None
+
+def render_collapsed(record: ProfileRecord) -> str:
+    """Collapsed-stack text (flamegraph.pl / speedscope input)."""
+    if record.mode == "sampling":
+        return "".join(f"{stack} {count}\n" for stack, count in record.data.most_common())
+    # cProfile keeps caller edges only, so emit caller;callee pairs weighted by own time in microseconds
+    lines = []
+    for (filename, line, name), (_, _, tottime, _, callers) in record.data.items():
+        callee = f"{name} ({os.path.basename(filename)}:{line})"
+        weight = int(tottime * 1_000_000)
+        if weight <= 0:
+            continue
+        if not callers:
+            lines.append(f"{callee} {weight}\n")
+            continue
+        total_calls = sum(stat[1] for stat in callers.values()) or 1
+        for (c_file, c_line, c_name), stat in callers.items():
+            share = int(weight * stat[1] / total_calls)
+            if share > 0:
+                lines.append(f"{c_name} ({os.path.basename(c_file)}:{c_line});{callee} {share}\n")
+    return "".join(lines)
+
+def render_pstats(record: ProfileRecord) -> bytes:
+    """Binary pstats dump, loadable with pstats.Stats(path) or snakeviz."""
+    if record.mode != "cprofile":
+        raise ValueError("pstats output is only available for cprofile profiles")
+    return marshal.dumps(record.data)
+
+def render_text(record: ProfileRecord, limit: int = 40) -> str:
+    if record.mode == "sampling":
+        total = sum(record.data.values()) or 1
+        lines = [f"{count / total:6.1%} {count:6d}  {stack}" for stack, count in record.data.most_common(limit)]
+        return "\n".join(lines) + "\n"
+    stream = io.StringIO()
+    pstats.Stats(_LoadedStats(record.data), stream=stream).sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
+
+class _LoadedStats:
+    """Adapter so pstats.Stats can read stats captured from a finished cProfile run."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+profiler = Profiler()
@@ -0,0 +1,191 @@
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.orm import Session
+from app.core.database import dialect_insert
+from app.models.chat import ChatMessage
+from app.models.usage import UsageRollup
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+import uuid
+
+UNKNOWN = "unknown"
+
+def _usage_key(message: ChatMessage) -> Tuple[str, date, str, str]:
+    timestamp = message.timestamp or datetime.utcnow()
+    return (message.user_id, timestamp.date(), message.provider or UNKNOWN, message.model or UNKNOWN)
+
+def record_usage(db: Session, messages: List[ChatMessage]):
+    """Add assistant message usage to the rollups inside the caller's transaction.
+    
+    Turns with estimated token counts only add to the estimated_* columns.
+    
+    Doesn't commit: call it right before committing the messages themselves so
+    rows and rollups are written together.
+    """
+    increments: Dict[Tuple[str, date, str, str], List[int]] = {}
+    for message in messages:
+        if message.role != "assistant":
+            continue
+        # Stamp the timestamp now so the rollup day matches the stored row
+        if message.timestamp is None:
+            message.timestamp = datetime.utcnow()
+        totals = increments.setdefault(_usage_key(message), [0, 0, 0, 0, 0, 0])
+        if message.tokens_estimated:
+            totals[4] += 1
+            totals[5] += message.tokens_used or 0
+            continue
+        totals[0] += 1
+        totals[1] += message.prompt_tokens or 0
+        totals[2] += message.completion_tokens or 0
+        totals[3] += message.tokens_used or 0
+    if not increments:
+        return
+    
+    now = datetime.utcnow()
+    values = [
+        {
+            "id": uuid.uuid4(),
+            "user_id": user_id,
+            "day": day,
+            "provider": provider,
+            "model": model,
+            "requests": requests,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens,
+            "estimated_requests": estimated_requests,
+            "estimated_tokens": estimated_tokens,
+            "updated_at": now,
+        }
+        for (user_id, day, provider, model), (requests, prompt_tokens, completion_tokens, total_tokens,
+                                              estimated_requests, estimated_tokens)
+        in increments.items()
+    ]
+    
+    stmt = dialect_insert(db, UsageRollup)
+    if stmt is not None:
+        stmt = stmt.values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "day", "provider", "model"],
+            set_={
+                "requests": UsageRollup.requests + stmt.excluded.requests,
+                "prompt_tokens": UsageRollup.prompt_tokens + stmt.excluded.prompt_tokens,
+                "completion_tokens": UsageRollup.completion_tokens + stmt.excluded.completion_tokens,
+                "total_tokens": UsageRollup.total_tokens + stmt.excluded.total_tokens,
+                # Rows from before these columns existed hold NULL
+                "estimated_requests": func.coalesce(UsageRollup.estimated_requests, 0) + stmt.excluded.estimated_requests,
+                "estimated_tokens": func.coalesce(UsageRollup.estimated_tokens, 0) + stmt.excluded.estimated_tokens,
+                "updated_at": stmt.excluded.updated_at,
+            }
+        )
+        db.execute(stmt)
+        return
+    
+    # Portable fallback for dialects without ON CONFLICT
+    for row in values:
+        rollup = db.query(UsageRollup).filter(
+            UsageRollup.user_id == row["user_id"],
+            UsageRollup.day == row["day"],
+            UsageRollup.provider == row["provider"],
+            UsageRollup.model == row["model"]
+        ).with_for_update().first()
+        if rollup is None:
+            db.add(UsageRollup(**row))
+            continue
+        rollup.requests += row["requests"]
+        rollup.prompt_tokens += row["prompt_tokens"]
+        rollup.completion_tokens += row["completion_tokens"]
+        rollup.total_tokens += row["total_tokens"]
+        rollup.estimated_requests = (rollup.estimated_requests or 0) + row["estimated_requests"]
+        rollup.estimated_tokens = (rollup.estimated_tokens or 0) + row["estimated_tokens"]
+
+def rebuild_usage_rollups(db: Session, user_id: Optional[str] = None) -> int:
+    """Recompute rollups from raw chat_messages rows. Returns the number of rollup rows written."""
+    delete_stmt = delete(UsageRollup)
+    if user_id is not None:
+        delete_stmt = delete_stmt.where(UsageRollup.user_id == user_id)
+    db.execute(delete_stmt)
+    
+    day = func.date(ChatMessage.timestamp)
+    provider = func.coalesce(ChatMessage.provider, UNKNOWN)
+    model = func.coalesce(ChatMessage.model, UNKNOWN)
+    estimated = ChatMessage.tokens_estimated.is_(True)
+    
+    def reported(column):
+        return func.coalesce(func.sum(case((estimated, 0), else_=func.coalesce(column, 0))), 0)
+    
+    query = select(
+        ChatMessage.user_id,
+        day,
+        provider,
+        model,
+        func.coalesce(func.sum(case((estimated, 0), else_=1)), 0),
+        reported(ChatMessage.prompt_tokens),
+        reported(ChatMessage.completion_tokens),
+        reported(ChatMessage.tokens_used),
+        func.coalesce(func.sum(case((estimated, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((estimated, func.coalesce(ChatMessage.tokens_used, 0)), else_=0)), 0),
+    ).where(ChatMessage.role == "assistant")
+    if user_id is not None:
+        query = query.where(ChatMessage.user_id == user_id)
+    query = query.group_by(ChatMessage.user_id, day, provider, model)
+    
+    now = datetime.utcnow()
+    rows = [
+        UsageRollup(
+            user_id=row[0],
+            day=date.fromisoformat(row[1]) if isinstance(row[1], str) else row[1],
+            provider=row[2],
+            model=row[3],
+            requests=row[4],
+            prompt_tokens=row[5],
+            completion_tokens=row[6],
+            total_tokens=row[7],
+            estimated_requests=row[8],
+            estimated_tokens=row[9],
+            updated_at=now
+        )
+        for row in db.execute(query)
+    ]
+    db.add_all(rows)
+    db.commit()
+    return len(rows)
+
+def query_usage(db: Session, user_id: Optional[str] = None, start: Optional[date] = None,
+                end: Optional[date] = None, provider: Optional[str] = None,
+                model: Optional[str] = None) -> Dict[str, Any]:
+    """Read usage rollups matching the filters, with totals."""
+    query = db.query(UsageRollup)
+    if user_id is not None:
+        query = query.filter(UsageRollup.user_id == user_id)
+    if start is not None:
+        query = query.filter(UsageRollup.day >= start)
+    if end is not None:
+        query = query.filter(UsageRollup.day <= end)
+    if provider is not None:
+        query = query.filter(UsageRollup.provider == provider)
+    if model is not None:
+        query = query.filter(UsageRollup.model == model)
+    
+    rows = query.order_by(UsageRollup.day, UsageRollup.provider, UsageRollup.model).all()
+    totals = {
+        "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+        "estimated_requests": 0, "estimated_tokens": 0,
+    }
+    items = []
+    for row in rows:
+        item = {
+            "user_id": row.user_id,
+            "day": row.day.isoformat(),
+            "provider": row.provider,
+            "model": row.model,
+            "requests": row.requests,
+            "prompt_tokens": row.prompt_tokens,
+            "completion_tokens": row.completion_tokens,
+            "total_tokens": row.total_tokens,
+            "estimated_requests": row.estimated_requests or 0,
+            "estimated_tokens": row.estimated_tokens or 0,
+        }
+        for key in totals:
+            totals[key] += item[key]
+        items.append(item)
+    return {"items": items, "totals": totals}
@@ -1,17 +1,57 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.v1 import chat, user, memory
+from contextlib import asynccontextmanager
+from app.api.v1 import chat, user, memory, usage, ws, admin
 from app.core.config import settings
+from app.core.database import init_db, prewarm_pool
+from app.core.profiling import profiler
+from app.core.activity import last_active
+from app.memory.index import memory_index
+from app.providers.factory import get_provider
+import asyncio
 import logging
 
 # Configure logging
 logging.basicConfig(level=settings.LOG_LEVEL.upper())
 logger = logging.getLogger(__name__)
 
+async def prewarm():
+    """Warm the connection pool and default provider client in the background."""
+    for name, step in (("database pool", prewarm_pool), ("default provider", get_provider)):
+        try:
+            await asyncio.to_thread(step)
+        except Exception as e:
+            logger.warning(f"Prewarm of {name} failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema checks run once per process, before the first request is served
+    if settings.INIT_DB_ON_STARTUP:
+        await asyncio.to_thread(init_db)
+    
+    prewarm_task = asyncio.create_task(prewarm()) if settings.PREWARM_ON_STARTUP else None
+    flush_task = asyncio.create_task(last_active.run(settings.LAST_ACTIVE_FLUSH_INTERVAL))
+    index_task = None
+    if settings.MEMORY_INDEX_ENABLED:
+        # Maps snapshots and replays recent rows in the background; searches return nothing until ready
+        index_task = asyncio.create_task(memory_index.run(
+            settings.MEMORY_INDEX_REFRESH_INTERVAL, settings.MEMORY_INDEX_SNAPSHOT_INTERVAL
+        ))
+    yield
+    if index_task:
+        index_task.cancel()
+        if memory_index.ready:
+            await asyncio.to_thread(memory_index.snapshot)
+    if prewarm_task and not prewarm_task.done():
+        prewarm_task.cancel()
+    flush_task.cancel()
+    await asyncio.to_thread(last_active.flush)
+
 app = FastAPI(
     title="MEMORAI - Persistent AI Memory Server",
     description="A middleware server that provides persistent memory for AI interactions",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -23,10 +63,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profile a sampled fraction of requests, or those carrying the debug header."""
+    # The debug header only forces a profile when it carries the admin token
+    forced = admin.is_admin_token(request.headers.get(settings.PROFILING_HEADER))
+    # Never profile the admin endpoints that read the profiles
+    if request.url.path.startswith("/api/v1/admin") or not profiler.should_profile(forced):
+        return await call_next(request)
+    
+    handle = profiler.start()
+    if handle is None:
+        return await call_next(request)
+    try:
+        response = await call_next(request)
+    finally:
+        record = profiler.stop(handle, request.method, request.url.path)
+    response.headers["X-Profile-Id"] = record.id
+    return response
+
 # Include API routes
 app.include_router(chat.router, prefix="/api/v1", tags=["chat"])
 app.include_router(user.router, prefix="/api/v1", tags=["user"])
 app.include_router(memory.router, prefix="/api/v1", tags=["memory"])
+app.include_router(usage.router, prefix="/api/v1", tags=["usage"])
+app.include_router(ws.router, prefix="/api/v1", tags=["chat"])
+app.include_router(admin.router, prefix="/api/v1", tags=["admin"])
 
 @app.get("/health")
 async def health_check():
@@ -40,4 +102,4 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
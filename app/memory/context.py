@@ -0,0 +1,175 @@
+from sqlalchemy.exc import IntegrityError
+from app.core.activity import last_active
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.profiling import profile_thread
+from app.memory.engine import MemoryEngine
+from app.memory.facts import FactStore
+from app.memory.prompt import CompiledPrompt, prompt_cache
+from app.models.chat import ChatMessage
+from app.models.user import User
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class ChatContext:
+    """Everything the provider call needs, plus how long each stage took."""
+
+    def __init__(self):
+        self.compiled_prompt: Optional[CompiledPrompt] = None
+        self.memories: List[Any] = []
+        self.facts: List[Tuple[str, str]] = []
+        self.history: List[Dict[str, str]] = []
+        self.skipped: List[str] = []
+        self.timings: Dict[str, float] = {}
+
+    def record(self, stage: str, started: float):
+        self.timings[stage] = (time.perf_counter() - started) * 1000
+
+    def server_timing(self) -> str:
+        """Render timings as a Server-Timing header value."""
+        return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in self.timings.items())
+
+@profile_thread
+def _load_user_prompt(user_id: str, context: ChatContext) -> CompiledPrompt:
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.user_id == user_id).first()
+        if not user:
+            user = User(user_id=user_id)
+            db.add(user)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Created concurrently by another request
+                db.rollback()
+                user = db.query(User).filter(User.user_id == user_id).one()
+        return prompt_cache.get(user)
+    finally:
+        db.close()
+        context.record("user", started)
+
+@profile_thread
+def _load_memories(user_id: str, message: str, context: ChatContext) -> List[Any]:
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        return MemoryEngine(db).get_relevant_memory_records(user_id, message)
+    finally:
+        db.close()
+        context.record("memories", started)
+
+@profile_thread
+def _load_facts(user_id: str, message: str, context: ChatContext) -> List[Tuple[str, str]]:
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        return FactStore(db).lookup(user_id, message)
+    finally:
+        db.close()
+        context.record("facts", started)
+
+@profile_thread
+def _load_history(user_id: str, turns: int, context: ChatContext) -> List[Dict[str, str]]:
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        rows = db.query(ChatMessage.role, ChatMessage.content).filter(
+            ChatMessage.user_id == user_id
+        ).order_by(
+            # A turn's two rows can share a timestamp; "assistant" sorts before "user"
+            ChatMessage.timestamp.desc(), ChatMessage.role.asc()
+        ).limit(turns * 2).all()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+    finally:
+        db.close()
+        context.record("history", started)
+
+_stage_executor: Optional[ThreadPoolExecutor] = None
+
+async def run_stage(func, *args):
+    """Run blocking database work on the bounded stage pool, keeping the caller's context like to_thread does."""
+    global _stage_executor
+    if _stage_executor is None:
+        _stage_executor = ThreadPoolExecutor(max_workers=settings.CONTEXT_STAGE_WORKERS, thread_name_prefix="memorai-context")
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_stage_executor, functools.partial(context.run, func, *args))
+
+def _discard(task: asyncio.Task):
+    """Let an abandoned stage finish in the background without unretrieved-exception warnings."""
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+async def assemble_context(user_id: str, message: str) -> ChatContext:
+    """Fetch the user prompt, memories, facts and history concurrently.
+    
+    The user stage is required. Memories, facts, then history are awaited until the
+    retrieval deadline; any stage still running then is dropped rather than
+    delaying the provider call.
+    """
+    context = ChatContext()
+    started = time.perf_counter()
+    
+    user_task = asyncio.create_task(run_stage(_load_user_prompt, user_id, context))
+    memories_task = asyncio.create_task(run_stage(_load_memories, user_id, message, context))
+    facts_task = asyncio.create_task(run_stage(_load_facts, user_id, message, context))
+    history_task = None
+    if settings.CONTEXT_HISTORY_TURNS > 0:
+        history_task = asyncio.create_task(
+            run_stage(_load_history, user_id, settings.CONTEXT_HISTORY_TURNS, context)
+        )
+    
+    try:
+        context.compiled_prompt = await user_task
+    except BaseException:
+        for task in (memories_task, facts_task, history_task):
+            if task is not None:
+                task.cancel()
+        raise
+    last_active.touch(user_id)
+    
+    deadline = started + settings.CONTEXT_RETRIEVAL_DEADLINE_MS / 1000
+    try:
+        context.memories = await asyncio.wait_for(
+            asyncio.shield(memories_task), timeout=max(deadline - time.perf_counter(), 0)
+        )
+    except asyncio.TimeoutError:
+        _discard(memories_task)
+        context.skipped.append("memories")
+        logger.warning(f"Memory retrieval for {user_id} missed the {settings.CONTEXT_RETRIEVAL_DEADLINE_MS}ms deadline")
+    except Exception as e:
+        context.skipped.append("memories")
+        logger.warning(f"Memory retrieval for {user_id} failed: {e}")
+    
+    try:
+        context.facts = await asyncio.wait_for(
+            asyncio.shield(facts_task), timeout=max(deadline - time.perf_counter(), 0)
+        )
+    except asyncio.TimeoutError:
+        _discard(facts_task)
+        context.skipped.append("facts")
+    except Exception as e:
+        context.skipped.append("facts")
+        logger.warning(f"Fact lookup for {user_id} failed: {e}")
+    
+    # History only gets whatever is left of the deadline
+    if history_task is not None:
+        try:
+            context.history = await asyncio.wait_for(
+                asyncio.shield(history_task), timeout=max(deadline - time.perf_counter(), 0)
+            )
+        except asyncio.TimeoutError:
+            _discard(history_task)
+            context.skipped.append("history")
+        except Exception as e:
+            context.skipped.append("history")
+            logger.warning(f"History retrieval for {user_id} failed: {e}")
+    
+    context.record("context", started)
+    return context
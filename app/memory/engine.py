@@ -2,13 +2,17 @@ from sqlalchemy.orm import Session
 from app.models.memory import Memory
 from app.models.user import User
 from app.models.chat import ChatMessage
+from app.memory.storage import MemoryStorage, MemoryRecord
+from app.memory.index import memory_index
+from app.core.config import settings
 from datetime import datetime, timedelta
-from typing import List
+from typing import Dict, List
 import uuid
 
 class MemoryEngine:
     def __init__(self, db: Session):
         self.db = db
+        self.storage = MemoryStorage(db)
     
     def get_relevant_memories(self, user_id: str, current_query: str) -> List[Memory]:
         """Retrieve relevant memories for the current query."""
@@ -23,8 +27,26 @@ class MemoryEngine:
         
         return memories
     
-    def store_conversation_memory(self, user_id: str, user_message: str, assistant_response: str):
-        """Store conversation parts as memory."""
+    def get_relevant_memory_records(self, user_id: str, current_query: str, limit: int = 10) -> List[MemoryRecord]:
+        """Read-only variant of get_relevant_memories that skips ORM entity loading."""
+        records = self.storage.get_memory_records(user_id, days=30, limit=limit)
+        
+        # Add older keyword matches from the memory index, when it is enabled
+        if settings.MEMORY_INDEX_ENABLED and memory_index.ready:
+            hit_ids = memory_index.search(user_id, current_query, limit=settings.MEMORY_INDEX_HITS)
+            seen = {record.content for record in records}
+            for record in self.storage.get_memory_records_by_ids(hit_ids):
+                if record.content not in seen:
+                    seen.add(record.content)
+                    records.append(record)
+        return records
+    
+    def get_relevant_memories_for_users(self, user_ids: List[str], limit: int = 10) -> Dict[str, List[MemoryRecord]]:
+        """Retrieve recent memory records for many users in a single query."""
+        return self.storage.get_memory_records_for_users(user_ids, days=30, limit=limit)
+    
+    def build_conversation_memories(self, user_id: str, user_message: str, assistant_response: str) -> List[Memory]:
+        """Build (but don't persist) the memories for one conversation turn."""
         # Store user message as memory
         user_memory = Memory(
             user_id=user_id,
@@ -43,8 +65,11 @@ class MemoryEngine:
             tags=["conversation", "assistant_response"]
         )
         
-        self.db.add(user_memory)
-        self.db.add(assistant_memory)
+        return [user_memory, assistant_memory]
+    
+    def store_conversation_memory(self, user_id: str, user_message: str, assistant_response: str):
+        """Store conversation parts as memory."""
+        self.db.add_all(self.build_conversation_memories(user_id, user_message, assistant_response))
         self.db.commit()
     
     def summarize_conversation(self, user_id: str, conversation_history: List[dict]) -> str:
@@ -0,0 +1,218 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.core.database import dialect_insert
+from app.models.fact import UserFact
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import re
+import uuid
+
+MAX_VALUE_LENGTH = 200
+
+# Specific patterns are tried before the generic "my X is Y" rule
+_VALUE = r"([^.,;!?\n]{1,%d})" % MAX_VALUE_LENGTH
+_NAME = r"([A-Z][\w'-]*(?: [A-Z][\w'-]*)*)"
+FACT_PATTERNS = [
+    ("name", re.compile(r"(?i:\bmy name is) " + _NAME)),
+    ("name", re.compile(r"(?i:\b(?:i am|i'm) called) " + _NAME)),
+    ("name", re.compile(r"(?i:\bcall me) " + _NAME)),
+    ("location", re.compile(r"\bi (?:live|am based|'m based) in " + _VALUE, re.IGNORECASE)),
+    ("employer", re.compile(r"\bi work (?:at|for) " + _VALUE, re.IGNORECASE)),
+    ("occupation", re.compile(r"\bi work as an? " + _VALUE, re.IGNORECASE)),
+    ("stack", re.compile(r"\bmy (?:tech )?stack is " + r"([^.;!?\n]{1,%d})" % MAX_VALUE_LENGTH, re.IGNORECASE)),
+    ("stack", re.compile(r"\bi (?:code|program|develop) (?:in|with) " + r"([^.;!?\n]{1,%d})" % MAX_VALUE_LENGTH, re.IGNORECASE)),
+]
+GENERIC_PATTERN = re.compile(r"\bmy ([a-z][a-z ]{1,30}?) (?:is|are) " + _VALUE, re.IGNORECASE)
+
+# A value ends where the next clause starts: "Paris and I work at...", "a startup but my boss..."
+_PRONOUNS = r"i|i'm|i've|i'd|i'll|me|my|we|we're|our|you|your|he|she|his|her|they|their|it|it's|this|that|there"
+CLAUSE_BOUNDARY = re.compile(
+    r",?\s+(?:and|or)\s+(?:%s)\b"
+    r"|,?\s+(?:but|because|so|although|though|while|which|who|since|until|when|where)\b"
+    r"|,\s*(?:%s)\b" % (_PRONOUNS, _PRONOUNS),
+    re.IGNORECASE
+)
+
+# "my X is Y" only becomes a fact for attribute nouns; "my code is broken" is not one
+GENERIC_KEYS = {
+    "name", "nickname", "age", "birthday", "pronouns", "email",
+    "city", "hometown", "country", "location", "timezone", "time zone",
+    "job", "profession", "occupation", "role", "title", "employer", "company", "team",
+    "school", "university", "major", "degree",
+    "stack", "tech stack", "language", "native language", "editor",
+    "wife", "husband", "partner", "hobby", "hobbies",
+}
+GENERIC_KEY_PREFIXES = ("favorite ", "favourite ")
+
+# Generic keys that mean the same thing as a specific one
+KEY_ALIASES = {
+    "tech stack": "stack",
+    "stack": "stack",
+    "job": "occupation",
+    "profession": "occupation",
+    "company": "employer",
+    "employer": "employer",
+    "city": "location",
+    "hometown": "location",
+}
+
+# Query words that should pull in a fact key even when the key itself isn't mentioned
+KEY_HINTS = {
+    "name": ("name", "called", "who am i"),
+    "location": ("live", "where", "city", "country", "based", "location"),
+    "employer": ("work", "company", "employer"),
+    "occupation": ("job", "occupation", "profession", "living", "work as"),
+    "stack": ("stack", "language", "framework", "tech", "tools", "code", "program"),
+}
+ALWAYS_INCLUDED = ("name",)
+QUERY_STOPWORDS = {
+    "a", "an", "and", "are", "am", "can", "did", "do", "does", "for", "from", "how", "i", "i'm", "in",
+    "is", "it", "me", "my", "of", "on", "or", "s", "the", "to", "use", "was", "what", "what's", "when",
+    "where", "which", "who", "why", "with", "you", "your",
+}
+
+ENTITY_PATTERN = re.compile(r"(?<![.!?]\s)(?<!^)\b([A-Z][\w.+#-]*[A-Za-z0-9+#](?: [A-Z][\w.+#-]*[A-Za-z0-9+#])*)")
+ENTITY_STOPWORDS = {"I", "I'm", "I've", "I'd", "I'll", "OK", "Ok"}
+MAX_ENTITIES = 10
+
+def normalize_key(text: str) -> str:
+    return re.sub(r"\s+", "_", text.strip().lower())
+
+def _clean_value(value: str) -> Optional[str]:
+    value = CLAUSE_BOUNDARY.split(value, 1)[0]
+    value = value.strip().strip("\"'").strip()
+    if not value or value.lower().startswith("not "):
+        return None
+    return value[:MAX_VALUE_LENGTH]
+
+def extract_facts(message: str) -> List[Tuple[str, str, str]]:
+    """Extract (key, value, kind) facts and entities from a user message."""
+    facts: Dict[str, Tuple[str, str]] = {}
+
+    # Later mentions in the message win, matching the latest-wins rule across messages
+    matches = []
+    for key, pattern in FACT_PATTERNS:
+        for match in pattern.finditer(message):
+            matches.append((match.start(), key, match.group(1)))
+    for _, key, raw_value in sorted(matches):
+        value = _clean_value(raw_value)
+        if value:
+            facts[key] = (value, "fact")
+
+    for match in GENERIC_PATTERN.finditer(message):
+        raw_key = re.sub(r"\s+", " ", match.group(1).strip().lower())
+        if raw_key not in GENERIC_KEYS and not raw_key.startswith(GENERIC_KEY_PREFIXES):
+            continue
+        key = KEY_ALIASES.get(raw_key, normalize_key(raw_key))
+        value = _clean_value(match.group(2))
+        # The specific patterns produce cleaner values for the same key
+        if value and key not in facts:
+            facts[key] = (value, "fact")
+
+    entities = 0
+    for match in ENTITY_PATTERN.finditer(message):
+        entity = match.group(1)
+        if entity in ENTITY_STOPWORDS or len(entity) < 2:
+            continue
+        key = "entity:" + normalize_key(entity)
+        if key not in facts:
+            facts[key] = (entity, "entity")
+            entities += 1
+            if entities >= MAX_ENTITIES:
+                break
+
+    return [(key, value, kind) for key, (value, kind) in facts.items()]
+
+def query_keys(query: str) -> List[str]:
+    """Fact keys worth looking up for a query."""
+    query_lower = query.lower()
+    words = [word for word in re.findall(r"[a-z0-9+#.'-]+", query_lower) if word not in QUERY_STOPWORDS]
+    keys = set(ALWAYS_INCLUDED)
+    for key, hints in KEY_HINTS.items():
+        if any(hint in query_lower for hint in hints):
+            keys.add(key)
+    for i, word in enumerate(words):
+        keys.add(word)
+        keys.add("entity:" + word)
+        if i + 1 < len(words):
+            bigram = f"{word}_{words[i + 1]}"
+            keys.add(bigram)
+            keys.add("entity:" + bigram)
+    return sorted(keys)
+
+class FactStore:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def upsert(self, user_id: str, message: str) -> int:
+        """Extract facts from a user message and upsert them; doesn't commit."""
+        facts = extract_facts(message)
+        if not facts:
+            return 0
+
+        now = datetime.utcnow()
+        values = [
+            {
+                "id": uuid.uuid4(),
+                "user_id": user_id,
+                "key": key,
+                "value": value,
+                "kind": kind,
+                "source_text": message[:1000],
+                "created_at": now,
+                "updated_at": now,
+            }
+            for key, value, kind in facts
+        ]
+
+        stmt = dialect_insert(self.db, UserFact)
+        if stmt is not None:
+            stmt = stmt.values(values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id", "key"],
+                set_={
+                    "value": stmt.excluded.value,
+                    "kind": stmt.excluded.kind,
+                    "source_text": stmt.excluded.source_text,
+                    "updated_at": stmt.excluded.updated_at,
+                }
+            )
+            self.db.execute(stmt)
+            return len(values)
+
+        # Portable fallback for dialects without ON CONFLICT
+        for row in values:
+            fact = self.db.query(UserFact).filter(
+                UserFact.user_id == user_id,
+                UserFact.key == row["key"]
+            ).with_for_update().first()
+            if fact is None:
+                self.db.add(UserFact(**row))
+                continue
+            fact.value = row["value"]
+            fact.kind = row["kind"]
+            fact.source_text = row["source_text"]
+            fact.updated_at = now
+        return len(values)
+
+    def lookup(self, user_id: str, query: str) -> List[Tuple[str, str]]:
+        """Direct index lookup of the facts relevant to a query."""
+        return self.lookup_many([user_id], {user_id: query}).get(user_id, [])
+
+    def lookup_many(self, user_ids: List[str], queries: Dict[str, str]) -> Dict[str, List[Tuple[str, str]]]:
+        """Look up relevant facts for several users in one query."""
+        keys = set()
+        for query in queries.values():
+            keys.update(query_keys(query))
+
+        stmt = select(UserFact.user_id, UserFact.key, UserFact.value).where(
+            UserFact.user_id.in_(user_ids),
+            UserFact.key.in_(sorted(keys))
+        ).order_by(UserFact.user_id, UserFact.kind.desc(), UserFact.key)
+
+        wanted = {user_id: set(query_keys(queries.get(user_id, ""))) for user_id in user_ids}
+        facts = {user_id: [] for user_id in user_ids}
+        for user_id, key, value in self.db.execute(stmt):
+            if key in wanted[user_id]:
+                facts[user_id].append((key, value))
+        return facts
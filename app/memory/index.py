@@ -0,0 +1,376 @@
+"""Keyword postings index over memories, with mmap-able snapshot segments.
+
+Each shard (crc32(user_id) % MEMORY_INDEX_SHARDS) is one segment file:
+
+    header   MAGIC, VERSION, shard, watermark, n_docs, n_terms, section offsets
+    docs     n_docs x (16-byte memory UUID, f64 created_at epoch)
+    terms    n_terms x (key offset, key length, postings offset, postings count), sorted by key
+    postings uint32 doc indices (native byte order)
+    strings  keys, "<user_id>\\x1f<term>" in UTF-8
+
+Segments are opened read-only with mmap, so every worker on a box shares the
+same page-cache pages. Rows changed after a segment's watermark
+(Memory.updated_at) are replayed into a small in-memory overlay. Deleted rows
+may linger in a segment until retention drops them; callers resolve hits
+against the database, so stale ids just don't come back.
+"""
+from sqlalchemy import select
+from array import array
+from collections import Counter
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.memory import Memory
+from app.utils.helpers import tokenize
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MEMIDX\x00\x01"
+VERSION = 1
+HEADER = struct.Struct("<8sIIdIIQQQQ")
+DOC = struct.Struct("<16sd")
+TERM = struct.Struct("<QIQI")
+KEY_SEPARATOR = "\x1f"
+# Replay re-reads a short window before the watermark to catch rows committed out of order
+REPLAY_OVERLAP = timedelta(seconds=5)
+# Boilerplate added by store_conversation_memory
+INDEX_STOP_WORDS = {"user", "said", "assistant", "replied"}
+
+def _epoch(value: Optional[datetime]) -> float:
+    return (value - datetime(1970, 1, 1)).total_seconds() if value else 0.0
+
+def _from_epoch(value: float) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(seconds=value)
+
+def index_terms(text: str) -> Set[str]:
+    return {word for word in tokenize(text or "") if word not in INDEX_STOP_WORDS}
+
+def index_key(user_id: str, term: str) -> bytes:
+    return f"{user_id}{KEY_SEPARATOR}{term}".encode("utf-8")
+
+def shard_for(user_id: str, shards: int) -> int:
+    return zlib.crc32(user_id.encode("utf-8")) % shards
+
+class Segment:
+    """A read-only, memory-mapped snapshot of one shard."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, self.shard, watermark, self.n_docs, self.n_terms,
+             self._off_docs, self._off_terms, self._off_postings, self._off_strings) = HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Unsupported index segment {path}: {magic!r} v{version}")
+        except Exception:
+            self._mm.close()
+            raise
+        self.watermark = _from_epoch(watermark)
+        self._view = memoryview(self._mm)
+        self._postings = self._view[self._off_postings:self._off_strings].cast("I")
+
+    def _term(self, i: int) -> Tuple[bytes, int, int]:
+        key_off, key_len, post_off, post_len = TERM.unpack_from(self._mm, self._off_terms + i * TERM.size)
+        start = self._off_strings + key_off
+        return self._mm[start:start + key_len], post_off, post_len
+
+    def postings(self, key: bytes) -> memoryview:
+        """Zero-copy doc indices for a key (empty if absent), by binary search."""
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, post_off, post_len = self._term(mid)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return self._postings[post_off:post_off + post_len]
+        return self._postings[0:0]
+
+    def doc(self, index: int) -> Tuple[bytes, float]:
+        return DOC.unpack_from(self._mm, self._off_docs + index * DOC.size)
+
+    def iter_terms(self) -> Iterable[Tuple[bytes, memoryview]]:
+        for i in range(self.n_terms):
+            key, post_off, post_len = self._term(i)
+            yield key, self._postings[post_off:post_off + post_len]
+
+def write_segment(path: str, shard: int, watermark: datetime,
+                  docs: List[Tuple[bytes, float]], terms: Dict[bytes, array]):
+    """Write a segment atomically (temp file + rename)."""
+    strings = bytearray()
+    postings = array("I")
+    term_table = bytearray()
+    for key in sorted(terms):
+        doc_ids = terms[key]
+        term_table += TERM.pack(len(strings), len(key), len(postings), len(doc_ids))
+        strings += key
+        postings.extend(doc_ids)
+
+    off_docs = HEADER.size
+    off_terms = off_docs + DOC.size * len(docs)
+    off_postings = off_terms + len(term_table)
+    off_strings = off_postings + postings.itemsize * len(postings)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, shard, _epoch(watermark), len(docs), len(terms),
+                            off_docs, off_terms, off_postings, off_strings))
+        for doc in docs:
+            f.write(DOC.pack(*doc))
+        f.write(term_table)
+        postings.tofile(f)
+        f.write(strings)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class _Overlay:
+    """Rows replayed since the segment watermark."""
+
+    def __init__(self):
+        self.docs: Dict[bytes, Tuple[float, datetime, Set[bytes]]] = {}
+        self.terms: Dict[bytes, Set[bytes]] = {}
+
+    def add(self, doc_id: bytes, created_at: float, updated_at: datetime, keys: Set[bytes]):
+        self.remove(doc_id)
+        self.docs[doc_id] = (created_at, updated_at, keys)
+        for key in keys:
+            self.terms.setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id: bytes):
+        entry = self.docs.pop(doc_id, None)
+        if entry is None:
+            return
+        for key in entry[2]:
+            ids = self.terms.get(key)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self.terms[key]
+
+class MemoryIndex:
+    def __init__(self, directory: str, shards: int):
+        self.directory = directory
+        self.shards = shards
+        self.segments: List[Optional[Segment]] = [None] * shards
+        self._mtimes: List[Optional[float]] = [None] * shards
+        self.overlays = [_Overlay() for _ in range(shards)]
+        self.watermark: Optional[datetime] = None
+        self.ready = False
+        self._lock = threading.RLock()
+
+    def _path(self, shard: int) -> str:
+        return os.path.join(self.directory, f"shard-{shard:04d}.seg")
+
+    def _load_segment(self, shard: int) -> Optional[Segment]:
+        path = self._path(shard)
+        if not os.path.exists(path):
+            return None
+        try:
+            self._mtimes[shard] = os.path.getmtime(path)
+            return Segment(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Ignoring index segment {path}: {e}")
+            return None
+
+    def open(self):
+        """Map existing snapshots and replay rows changed since their watermark."""
+        os.makedirs(self.directory, exist_ok=True)
+        segments = [self._load_segment(shard) for shard in range(self.shards)]
+        watermarks = [segment.watermark for segment in segments if segment is not None]
+        with self._lock:
+            self.segments = segments
+            # A missing shard means a full replay
+            self.watermark = min(watermarks) if len(watermarks) == self.shards else None
+        self.replay()
+        self.ready = True
+
+    def replay(self) -> int:
+        """Fold rows with updated_at past the watermark into the overlays."""
+        since = self.watermark - REPLAY_OVERLAP if self.watermark else None
+        stmt = select(Memory.id, Memory.user_id, Memory.content, Memory.created_at, Memory.updated_at)
+        if since is not None:
+            stmt = stmt.where(Memory.updated_at > since)
+
+        count = 0
+        newest = self.watermark
+        db = SessionLocal()
+        try:
+            for memory_id, user_id, content, created_at, updated_at in db.execute(stmt.execution_options(yield_per=10000)):
+                shard = shard_for(user_id, self.shards)
+                keys = {index_key(user_id, term) for term in index_terms(content)}
+                with self._lock:
+                    self.overlays[shard].add(memory_id.bytes, _epoch(created_at), updated_at, keys)
+                if updated_at and (newest is None or updated_at > newest):
+                    newest = updated_at
+                count += 1
+        finally:
+            db.close()
+        with self._lock:
+            self.watermark = newest
+        return count
+
+    def reload_newer_segments(self) -> int:
+        """Pick up snapshots written by other workers."""
+        reloaded = 0
+        for shard in range(self.shards):
+            try:
+                mtime = os.path.getmtime(self._path(shard))
+            except OSError:
+                continue
+            if self._mtimes[shard] == mtime:
+                continue
+            segment = self._load_segment(shard)
+            self._mtimes[shard] = mtime
+            current = self.segments[shard]
+            if segment is None or (current is not None and segment.watermark <= current.watermark):
+                continue
+            with self._lock:
+                self.segments[shard] = segment
+                # Rows covered by the new snapshot no longer need the overlay
+                overlay = self.overlays[shard]
+                for doc_id in [d for d, entry in overlay.docs.items() if entry[1] and entry[1] <= segment.watermark]:
+                    overlay.remove(doc_id)
+            reloaded += 1
+        return reloaded
+
+    def search(self, user_id: str, query: str, limit: int = 5) -> List[uuid.UUID]:
+        """Memory ids ranked by matched query terms, then recency."""
+        if not self.ready:
+            return []
+        terms = index_terms(query)
+        if not terms:
+            return []
+        shard = shard_for(user_id, self.shards)
+        with self._lock:
+            segment = self.segments[shard]
+            overlay = self.overlays[shard]
+            scores = Counter()
+            created: Dict[bytes, float] = {}
+            for term in terms:
+                key = index_key(user_id, term)
+                matched = set()
+                if segment is not None:
+                    for doc_index in segment.postings(key):
+                        doc_id, created_at = segment.doc(doc_index)
+                        # A replayed row supersedes its snapshot copy, including the terms it no longer has
+                        if doc_id in overlay.docs:
+                            continue
+                        matched.add(doc_id)
+                        created[doc_id] = created_at
+                for doc_id in overlay.terms.get(key, ()):
+                    matched.add(doc_id)
+                    created[doc_id] = overlay.docs[doc_id][0]
+                scores.update(matched)
+        ranked = sorted(scores, key=lambda doc_id: (scores[doc_id], created[doc_id]), reverse=True)
+        return [uuid.UUID(bytes=doc_id) for doc_id in ranked[:limit]]
+
+    def snapshot(self) -> int:
+        """Merge each shard's segment and overlay into a new segment file. Returns shards written."""
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, ".snapshot.lock"), "w")
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another worker is writing; we'll map its result on the next reload
+                    return 0
+            written = 0
+            for shard in range(self.shards):
+                if self._snapshot_shard(shard):
+                    written += 1
+            return written
+        finally:
+            lock_file.close()
+
+    def _snapshot_shard(self, shard: int) -> bool:
+        with self._lock:
+            segment = self.segments[shard]
+            overlay = self.overlays[shard]
+            watermark = self.watermark or datetime.utcnow()
+            captured = {doc_id: (entry[0], entry[1], set(entry[2])) for doc_id, entry in overlay.docs.items()}
+        # Empty shards still get a segment so its watermark spares the next start a full replay
+        if segment is not None and not captured and segment.watermark >= watermark:
+            return False
+
+        retention_cutoff = _epoch(datetime.utcnow() - timedelta(days=settings.MEMORY_RETENTION_DAYS))
+        docs: List[Tuple[bytes, float]] = []
+        new_index: Dict[bytes, int] = {}
+        remap: Dict[int, int] = {}
+        if segment is not None:
+            for old_index in range(segment.n_docs):
+                doc_id, created_at = segment.doc(old_index)
+                # Overlay rows supersede their snapshot copy; expired rows are dropped
+                if doc_id in captured or created_at < retention_cutoff:
+                    continue
+                remap[old_index] = len(docs)
+                new_index[doc_id] = len(docs)
+                docs.append((doc_id, created_at))
+        for doc_id, (created_at, _, _) in captured.items():
+            if created_at < retention_cutoff:
+                continue
+            new_index[doc_id] = len(docs)
+            docs.append((doc_id, created_at))
+
+        terms: Dict[bytes, array] = {}
+        if segment is not None:
+            for key, postings in segment.iter_terms():
+                kept = array("I", (remap[i] for i in postings if i in remap))
+                if kept:
+                    terms[key] = kept
+        for doc_id, (_, _, keys) in captured.items():
+            if doc_id not in new_index:
+                continue
+            for key in keys:
+                terms.setdefault(key, array("I")).append(new_index[doc_id])
+
+        write_segment(self._path(shard), shard, watermark, docs, terms)
+        new_segment = self._load_segment(shard)
+        with self._lock:
+            self.segments[shard] = new_segment
+            for doc_id, entry in captured.items():
+                current = overlay.docs.get(doc_id)
+                # Leave rows that were replayed again while we were writing
+                if current is not None and current[1] == entry[1]:
+                    overlay.remove(doc_id)
+        return True
+
+    async def run(self, refresh_interval: float, snapshot_interval: float):
+        """Replay changes and write snapshots periodically until cancelled."""
+        if not self.ready:
+            await asyncio.to_thread(self.open)
+            if any(segment is None for segment in self.segments):
+                # First start (or a lost shard): persist the full build right away
+                await asyncio.to_thread(self.snapshot)
+        last_snapshot = time.monotonic()
+        while True:
+            await asyncio.sleep(refresh_interval)
+            try:
+                await asyncio.to_thread(self.reload_newer_segments)
+                await asyncio.to_thread(self.replay)
+                if time.monotonic() - last_snapshot >= snapshot_interval:
+                    await asyncio.to_thread(self.snapshot)
+                    last_snapshot = time.monotonic()
+            except Exception as e:
+                logger.warning(f"Memory index refresh failed: {e}")
+
+memory_index = MemoryIndex(settings.MEMORY_INDEX_DIR, settings.MEMORY_INDEX_SHARDS)
@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import threading
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant."
+
+class CompiledPrompt:
+    """The stable, cacheable system prompt for a user."""
+    __slots__ = ("user_id", "version", "content", "source")
+
+    def __init__(self, user_id: str, version: str, content: str, source: tuple):
+        self.user_id = user_id
+        self.version = version
+        self.content = content
+        self.source = source
+
+def _prompt_source(user) -> tuple:
+    """The user fields the stable prompt is built from."""
+    profile = user.profile or {}
+    return (
+        user.system_prompt or "",
+        profile.get("name") or "",
+        profile.get("language") or "",
+        profile.get("custom_instructions") or "",
+    )
+
+def compile_prompt(user) -> CompiledPrompt:
+    """Build the stable system prompt for a user. Never includes per-turn memory context."""
+    source = _prompt_source(user)
+    system_prompt, name, language, custom_instructions = source
+    
+    system_prompt_parts = []
+    if system_prompt:
+        system_prompt_parts.append(system_prompt)
+    if name:
+        system_prompt_parts.append(f"User name: {name}")
+    if language:
+        system_prompt_parts.append(f"Preferred language: {language}")
+    if custom_instructions:
+        system_prompt_parts.append(custom_instructions)
+    
+    content = "\n".join(system_prompt_parts) if system_prompt_parts else DEFAULT_SYSTEM_PROMPT
+    version = hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+    return CompiledPrompt(user.user_id, version, content, source)
+
+def build_memory_block(memories: List[Any], facts: Optional[List[Tuple[str, str]]] = None) -> Optional[str]:
+    """Build the volatile per-turn memory message content."""
+    parts = []
+    if facts:
+        fact_lines = []
+        for key, value in facts:
+            label = "mentioned" if key.startswith("entity:") else key.replace("_", " ")
+            fact_lines.append(f"- {label}: {value}")
+        parts.append("Known facts about the user:\n" + "\n".join(fact_lines))
+    if memories:
+        memory_context = "\n".join([mem.content for mem in memories])
+        parts.append(f"Relevant context from previous conversations:\n{memory_context}")
+    return "\n\n".join(parts) if parts else None
+
+def build_messages(compiled: CompiledPrompt, memory_block: Optional[str], message: str,
+                   history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
+    """Stable prefix first, then volatile context and recent turns, then the user turn."""
+    messages = [{"role": "system", "content": compiled.content}]
+    if memory_block:
+        messages.append({"role": "system", "content": memory_block})
+    if history:
+        messages.extend(history)
+    messages.append({"role": "user", "content": message})
+    return messages
+
+class PromptCache:
+    """Bounded per-process cache of compiled prompts, keyed by user_id."""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, CompiledPrompt]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.compiles = 0
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def get(self, user) -> CompiledPrompt:
+        """Return the cached prompt, recompiling only if the user's prompt fields changed."""
+        with self._lock:
+            compiled = self._entries.get(user.user_id)
+            if compiled is not None:
+                self._entries.move_to_end(user.user_id)
+        # Comparing the source fields also catches edits made by other workers
+        if compiled is not None and compiled.source == _prompt_source(user):
+            return compiled
+        return self.compile(user)
+
+    def peek(self, user_id: str) -> Optional[CompiledPrompt]:
+        """Return the cached prompt for a user without validating it against a User row."""
+        with self._lock:
+            return self._entries.get(user_id)
+
+    def compile(self, user) -> CompiledPrompt:
+        """Rebuild and store the prompt for a user."""
+        compiled = compile_prompt(user)
+        with self._lock:
+            self._entries[user.user_id] = compiled
+            self._entries.move_to_end(user.user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self.compiles += 1
+        return compiled
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def record_usage(self, usage: Dict[str, Any]):
+        """Accumulate provider-reported prompt and cached-prefix token counts."""
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += usage.get("prompt_tokens", 0) or 0
+            self.cached_tokens += usage.get("cached_tokens", 0) or 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cached_prompts": len(self._entries),
+                "compiles": self.compiles,
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cached_token_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            }
+
+prompt_cache = PromptCache()
@@ -1,9 +1,25 @@
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from app.models.memory import Memory
 from app.models.user import User
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 from uuid import UUID
 
+class MemoryRecord:
+    """Read-only projection of a memory row used by the retrieval path."""
+    __slots__ = ("user_id", "content", "memory_type", "created_at", "score")
+
+    def __init__(self, user_id: str, content: str, memory_type: str, created_at: datetime, score: int):
+        self.user_id = user_id
+        self.content = content
+        self.memory_type = memory_type
+        self.created_at = created_at
+        self.score = score
+
+# Only the columns retrieval needs; skips tags JSON decoding and ORM identity tracking
+_RECORD_COLUMNS = (Memory.user_id, Memory.content, Memory.memory_type, Memory.created_at, Memory.relevance_score)
+
 class MemoryStorage:
     def __init__(self, db: Session):
         self.db = db
@@ -55,6 +71,51 @@ class MemoryStorage:
         
         return memories
 
+    def get_memory_records(self, user_id: str, days: int = 30, limit: int = 10) -> List[MemoryRecord]:
+        """Get recent memories for a user as lightweight read-only records"""
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        stmt = select(*_RECORD_COLUMNS).where(
+            Memory.user_id == user_id,
+            Memory.created_at >= cutoff_date
+        ).order_by(Memory.created_at.desc()).limit(limit)
+        
+        return [MemoryRecord(*row) for row in self.db.execute(stmt)]
+
+    def get_memory_records_by_ids(self, memory_ids: List[UUID]) -> List[MemoryRecord]:
+        """Resolve memory ids (e.g. index hits) to records, in the given order"""
+        if not memory_ids:
+            return []
+        stmt = select(Memory.id, *_RECORD_COLUMNS).where(Memory.id.in_(memory_ids))
+        by_id = {row[0]: MemoryRecord(*row[1:]) for row in self.db.execute(stmt)}
+        return [by_id[memory_id] for memory_id in memory_ids if memory_id in by_id]
+
+    def get_memory_records_for_users(self, user_ids: List[str], days: int = 30,
+                                     limit: int = 10) -> Dict[str, List[MemoryRecord]]:
+        """Get the most recent memories for many users in one query"""
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        
+        # Rank each user's memories newest-first and keep the top `limit` per user
+        ranked = select(
+            *_RECORD_COLUMNS,
+            func.row_number().over(
+                partition_by=Memory.user_id,
+                order_by=Memory.created_at.desc()
+            ).label("rank")
+        ).where(
+            Memory.user_id.in_(user_ids),
+            Memory.created_at >= cutoff_date
+        ).subquery()
+        
+        stmt = select(
+            ranked.c.user_id, ranked.c.content, ranked.c.memory_type,
+            ranked.c.created_at, ranked.c.relevance_score
+        ).where(ranked.c.rank <= limit).order_by(ranked.c.user_id, ranked.c.created_at.desc())
+        
+        records_by_user = {user_id: [] for user_id in user_ids}
+        for row in self.db.execute(stmt):
+            records_by_user[row[0]].append(MemoryRecord(*row))
+        return records_by_user
+
     def update_memory_importance(self, memory_id: UUID, importance_score: int):
         """Update the importance score of a memory"""
         memory = self.db.query(Memory).filter(Memory.id == memory_id).first()
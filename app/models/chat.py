@@ -1,5 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, Integer
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Uuid, String, DateTime, Text, Integer, Boolean
 from app.core.database import Base
 import uuid
 from datetime import datetime
@@ -7,9 +6,14 @@ from datetime import datetime
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     user_id = Column(String, index=True, nullable=False)
     role = Column(String, nullable=False)  # user, assistant, system
     content = Column(Text, nullable=False)
     tokens_used = Column(Integer, default=0)
-    timestamp = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    tokens_estimated = Column(Boolean, default=False)  # counted locally, not reported by the provider
+    provider = Column(String, nullable=True)
+    model = Column(String, nullable=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Uuid, String, DateTime, Text, UniqueConstraint
+from app.core.database import Base
+import uuid
+from datetime import datetime
+
+class UserFact(Base):
+    """A stable key/value fact or named entity about a user; the latest value per key wins."""
+    __tablename__ = "user_facts"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_user_fact_key"),
+    )
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = Column(String, index=True, nullable=False)
+    key = Column(String, nullable=False)  # e.g. name, location, stack, entity:postgres
+    value = Column(Text, nullable=False)
+    kind = Column(String, default="fact")  # fact, entity
+    source_text = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
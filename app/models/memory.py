@@ -1,5 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, Integer, JSON
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Uuid, String, DateTime, Text, Integer, JSON
 from app.core.database import Base
 import uuid
 from datetime import datetime
@@ -7,11 +6,11 @@ from datetime import datetime
 class Memory(Base):
     __tablename__ = "memories"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     user_id = Column(String, index=True, nullable=False)
     memory_type = Column(String, index=True)  # short_term, long_term, summary
     content = Column(Text)
     relevance_score = Column(Integer, default=0)
     tags = Column(JSON, default=[])
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # index replay watermark
\ No newline at end of file
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Uuid, String, DateTime, Date, Integer, UniqueConstraint
+from app.core.database import Base
+import uuid
+from datetime import datetime
+
+class UsageRollup(Base):
+    """Token usage per user, day, provider and model, maintained alongside chat_messages."""
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", "provider", "model", name="uq_usage_rollup_key"),
+    )
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = Column(String, index=True, nullable=False)
+    day = Column(Date, index=True, nullable=False)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    requests = Column(Integer, default=0, nullable=False)
+    prompt_tokens = Column(Integer, default=0, nullable=False)
+    completion_tokens = Column(Integer, default=0, nullable=False)
+    total_tokens = Column(Integer, default=0, nullable=False)
+    # Turns whose counts were estimated locally are kept apart from provider-reported usage
+    estimated_requests = Column(Integer, default=0)
+    estimated_tokens = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,5 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, Integer, JSON
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Uuid, String, DateTime, Text, Integer, JSON
 from app.core.database import Base
 import uuid
 from datetime import datetime
@@ -7,7 +6,7 @@ from datetime import datetime
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     user_id = Column(String, unique=True, index=True, nullable=False)
     profile = Column(JSON, default={})
     system_prompt = Column(Text, default="")
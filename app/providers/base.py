@@ -1,5 +1,18 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, AsyncGenerator
+from typing import Dict, Any, AsyncGenerator, Optional
+
+class ProviderError(Exception):
+    """A failed provider call, with the upstream HTTP status when there was one."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, timed_out: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.timed_out = timed_out
+
+    @property
+    def overloaded(self) -> bool:
+        """Timeouts, rate limits and server errors; anything else is a problem with the request itself."""
+        return self.timed_out or self.status_code == 429 or (self.status_code or 0) >= 500
 
 class BaseProvider(ABC):
     @abstractmethod
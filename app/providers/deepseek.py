@@ -1,4 +1,4 @@
-from app.providers.base import BaseProvider
+from app.providers.base import BaseProvider, ProviderError
 from typing import Dict, Any, List
 import httpx
 
@@ -23,15 +23,18 @@ class DeepSeekProvider(BaseProvider):
             payload["max_tokens"] = kwargs["max_tokens"]
             
         async with httpx.AsyncClient() as client:
-            response = await client.post(
-                self.base_url,
-                headers=headers,
-                json=payload,
-                timeout=30.0
-            )
+            try:
+                response = await client.post(
+                    self.base_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=30.0
+                )
+            except httpx.TimeoutException as e:
+                raise ProviderError(f"DeepSeek API error: timed out ({str(e)})", timed_out=True) from e
             
             if response.status_code != 200:
-                raise Exception(f"DeepSeek API error: {response.status_code} - {response.text}")
+                raise ProviderError(f"DeepSeek API error: {response.status_code} - {response.text}", status_code=response.status_code)
                 
             result = response.json()
             return {
@@ -1,13 +1,31 @@
-from app.providers.openai import OpenAIProvider
 from app.providers.base import BaseProvider
 from app.core.config import settings
+from importlib import import_module
+import threading
+
+# Provider classes are imported on first use so that importing the app doesn't pull in vendor SDKs
+PROVIDER_REGISTRY = {
+    "openai": "app.providers.openai:OpenAIProvider",
+}
+
+_instances = {}
+_lock = threading.Lock()
 
 def get_provider(provider_name: str = None) -> BaseProvider:
     """Factory function to get the appropriate provider instance."""
     if not provider_name:
         provider_name = settings.DEFAULT_PROVIDER.lower()
     
-    if provider_name == "openai":
-        return OpenAIProvider()
-    else:
-        raise ValueError(f"Unsupported provider: {provider_name}")
\ No newline at end of file
+    provider = _instances.get(provider_name)
+    if provider is not None:
+        return provider
+    
+    if provider_name not in PROVIDER_REGISTRY:
+        raise ValueError(f"Unsupported provider: {provider_name}")
+    
+    with _lock:
+        if provider_name not in _instances:
+            module_path, class_name = PROVIDER_REGISTRY[provider_name].split(":")
+            provider_class = getattr(import_module(module_path), class_name)
+            _instances[provider_name] = provider_class()
+        return _instances[provider_name]
@@ -1,6 +1,6 @@
-from app.providers.base import BaseProvider
+from app.providers.base import BaseProvider, ProviderError
 from typing import Dict, Any, AsyncGenerator
-from openai import AsyncOpenAI
+from openai import APITimeoutError, AsyncOpenAI
 from app.core.config import settings
 
 class OpenAIProvider(BaseProvider):
@@ -20,11 +20,30 @@ class OpenAIProvider(BaseProvider):
                 "usage": {
                     "prompt_tokens": response.usage.prompt_tokens,
                     "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
+                    "total_tokens": response.usage.total_tokens,
+                    "cached_tokens": self._cached_tokens(response.usage)
                 }
             }
         except Exception as e:
-            raise Exception(f"OpenAI API Error: {str(e)}")
+            raise self._error("OpenAI API Error", e) from e
+    
+    @staticmethod
+    def _error(prefix: str, e: Exception) -> ProviderError:
+        return ProviderError(
+            f"{prefix}: {str(e)}",
+            status_code=getattr(e, "status_code", None),
+            timed_out=isinstance(e, APITimeoutError)
+        )
+    
+    @staticmethod
+    def _cached_tokens(usage) -> int:
+        """Prompt tokens served from the provider's prefix cache, if reported."""
+        details = getattr(usage, "prompt_tokens_details", None)
+        if details is None:
+            return 0
+        if isinstance(details, dict):
+            return details.get("cached_tokens") or 0
+        return getattr(details, "cached_tokens", 0) or 0
     
     async def stream_completion(self, messages: list, **kwargs) -> AsyncGenerator[str, None]:
         try:
@@ -38,4 +57,4 @@ class OpenAIProvider(BaseProvider):
                 if chunk.choices and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
         except Exception as e:
-            raise Exception(f"OpenAI Stream Error: {str(e)}")
\ No newline at end of file
+            raise self._error("OpenAI Stream Error", e) from e
\ No newline at end of file
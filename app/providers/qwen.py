@@ -1,4 +1,4 @@
-from app.providers.base import BaseProvider
+from app.providers.base import BaseProvider, ProviderError
 from typing import Dict, Any, List
 import httpx
 
@@ -34,15 +34,18 @@ class QwenProvider(BaseProvider):
             payload["parameters"]["max_tokens"] = kwargs["max_tokens"]
             
         async with httpx.AsyncClient() as client:
-            response = await client.post(
-                self.base_url,
-                headers=headers,
-                json=payload,
-                timeout=30.0
-            )
+            try:
+                response = await client.post(
+                    self.base_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=30.0
+                )
+            except httpx.TimeoutException as e:
+                raise ProviderError(f"Qwen API error: timed out ({str(e)})", timed_out=True) from e
             
             if response.status_code != 200:
-                raise Exception(f"Qwen API error: {response.status_code} - {response.text}")
+                raise ProviderError(f"Qwen API error: {response.status_code} - {response.text}", status_code=response.status_code)
                 
             result = response.json()
             return {
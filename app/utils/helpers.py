@@ -7,13 +7,18 @@ def count_tokens(text: str) -> int:
     # In a real implementation, use tiktoken or similar
     return len(re.findall(r'\b\w+\b', text))
 
+STOP_WORDS = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should'}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words longer than two characters, without stop words"""
+    words = re.findall(r'\b\w+\b', text.lower())
+    # Remove common stop words
+    return [word for word in words if word not in STOP_WORDS and len(word) > 2]
+
 def extract_keywords(text: str, num_keywords: int = 5) -> List[str]:
     """Extract keywords from text"""
     # Simple keyword extraction - in reality, would use NLP techniques
-    words = re.findall(r'\b\w+\b', text.lower())
-    # Remove common stop words
-    stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should'}
-    filtered_words = [word for word in words if word not in stop_words and len(word) > 2]
+    filtered_words = tokenize(text)
     
     # Count frequency and return top keywords
     word_freq = {}
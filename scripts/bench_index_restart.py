@@ -0,0 +1,140 @@
+"""Restart-time benchmark for the memory keyword index.
+
+Seeds a throwaway SQLite database, then compares a cold start (full rebuild
+from the memories table) with a warm start (mmap the snapshot segments and
+replay only rows changed since the watermark). Each start runs in a fresh
+interpreter so the timings and peak RSS are comparable.
+
+    python scripts/bench_index_restart.py --memories 1000000 --users 1000 --changed 1000
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORDS = ("deploy kubernetes postgres latency invoice travel recipe garden python rust budget meeting "
+         "deadline migration cache replica backup sprint design review hiring coffee weekend").split()
+
+# Runs in a child process: open (and optionally snapshot) the index, then report
+OPEN_SNIPPET = """
+import json, resource, sys, time
+from app.memory.index import MemoryIndex
+index = MemoryIndex(sys.argv[1], int(sys.argv[2]))
+start = time.perf_counter()
+index.open()
+opened = time.perf_counter()
+written = 0
+if sys.argv[3] == "snapshot":
+    written = index.snapshot()
+done = time.perf_counter()
+search_start = time.perf_counter()
+for i in range(200):
+    index.search(f"user-{i % 50}", "kubernetes latency budget")
+search_ms = (time.perf_counter() - search_start) / 200 * 1000
+print(json.dumps({
+    "open_s": opened - start,
+    "snapshot_s": done - opened,
+    "shards_written": written,
+    "overlay_docs": sum(len(o.docs) for o in index.overlays),
+    "search_ms": search_ms,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+def seed(count, users, changed):
+    from app.core.database import get_engine, init_db
+    from app.models.memory import Memory
+
+    init_db()
+    table = Memory.__table__
+    base = datetime.utcnow() - timedelta(days=20)
+    rng = random.Random(42)
+    with get_engine().begin() as conn:
+        batch = []
+        for i in range(count):
+            created = base + timedelta(seconds=i)
+            batch.append({
+                "id": uuid.uuid4(),
+                "user_id": f"user-{i % users}",
+                "memory_type": "short_term",
+                "content": "User said: " + " ".join(rng.choice(WORDS) for _ in range(12)),
+                "relevance_score": 5,
+                "tags": ["conversation"],
+                "created_at": created,
+                "updated_at": created,
+            })
+            if len(batch) == 10000:
+                conn.execute(table.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(table.insert(), batch)
+
+def add_changed(changed, users):
+    from app.core.database import get_engine
+    from app.models.memory import Memory
+
+    # Newer than the snapshot watermark (and its replay overlap window)
+    now = datetime.utcnow() + timedelta(minutes=1)
+    with get_engine().begin() as conn:
+        conn.execute(Memory.__table__.insert(), [
+            {
+                "id": uuid.uuid4(),
+                "user_id": f"user-{i % users}",
+                "memory_type": "short_term",
+                "content": "User said: kubernetes latency budget follow-up",
+                "relevance_score": 5,
+                "tags": ["conversation"],
+                "created_at": now,
+                "updated_at": now,
+            }
+            for i in range(changed)
+        ])
+
+def run_open(env, directory, shards, mode):
+    result = subprocess.run(
+        [sys.executable, "-c", OPEN_SNIPPET, directory, str(shards), mode],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--memories", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--changed", type=int, default=1000, help="rows written after the snapshot")
+    parser.add_argument("--shards", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        env = dict(os.environ)
+        sys.path.insert(0, ROOT)
+        index_dir = os.path.join(tmp, "index")
+
+        start = time.perf_counter()
+        seed(args.memories, args.users, args.changed)
+        print(f"seeded {args.memories} memories for {args.users} users in {time.perf_counter() - start:.1f}s")
+
+        cold = run_open(env, index_dir, args.shards, "snapshot")
+        add_changed(args.changed, args.users)
+        warm = run_open(env, index_dir, args.shards, "none")
+
+        size_mb = sum(os.path.getsize(os.path.join(index_dir, name))
+                      for name in os.listdir(index_dir) if name.endswith(".seg")) / (1024 * 1024)
+        print(f"snapshot: {size_mb:.1f} MiB across {args.shards} shards, written in {cold['snapshot_s']:.2f}s")
+        print(f"{'start':>6} {'open':>10} {'replayed':>10} {'search':>10} {'max rss':>10}")
+        for name, result in (("cold", cold), ("warm", warm)):
+            print(f"{name:>6} {result['open_s']:>9.2f}s {result['overlay_docs']:>10} "
+                  f"{result['search_ms']:>8.3f}ms {result['max_rss_mb']:>7.0f} MiB")
+
+if __name__ == "__main__":
+    main()
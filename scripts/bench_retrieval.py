@@ -0,0 +1,93 @@
+"""Retrieval benchmark: ORM entities vs column-projected records.
+
+Seeds a throwaway SQLite database with N memories per user and compares
+latency and peak allocations of MemoryEngine.get_relevant_memories against
+MemoryEngine.get_relevant_memory_records.
+
+    python scripts/bench_retrieval.py --memories 10000 --limit 10 --limit 1000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def seed(db, user_id, count):
+    from app.models.memory import Memory
+    
+    now = datetime.utcnow()
+    db.bulk_insert_mappings(Memory, [
+        {
+            "user_id": user_id,
+            "memory_type": "short_term",
+            "content": f"User said: benchmark message number {i} " + "x" * 80,
+            "relevance_score": 5,
+            "tags": ["conversation", "user_input"],
+            "created_at": now - timedelta(seconds=i),
+        }
+        for i in range(count)
+    ])
+    db.commit()
+
+def measure(fn, runs):
+    """Return (median seconds, peak allocated bytes) for fn()."""
+    fn()  # warm statement cache
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--memories", type=int, default=10000, help="memories per user")
+    parser.add_argument("--limit", type=int, action="append", help="rows fetched per call (repeatable)")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    limits = args.limit or [10, 1000]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        sys.path.insert(0, ROOT)
+        from app.core.database import SessionLocal, init_db
+        from app.memory.engine import MemoryEngine
+        from app.models.memory import Memory
+        
+        init_db()
+        db = SessionLocal()
+        seed(db, "bench-user", args.memories)
+        engine = MemoryEngine(db)
+        
+        def orm_path(limit):
+            # Same query as get_relevant_memories, with a configurable limit
+            db.expunge_all()
+            cutoff = datetime.utcnow() - timedelta(days=30)
+            return db.query(Memory).filter(
+                Memory.user_id == "bench-user",
+                Memory.created_at >= cutoff
+            ).order_by(Memory.created_at.desc()).limit(limit).all()
+        
+        print(f"{args.memories} memories/user, median of {args.runs} runs")
+        print(f"{'limit':>6} {'path':>8} {'latency':>12} {'peak alloc':>12}")
+        for limit in limits:
+            orm_time, orm_peak = measure(lambda: orm_path(limit), args.runs)
+            rec_time, rec_peak = measure(
+                lambda: engine.get_relevant_memory_records("bench-user", "", limit=limit), args.runs
+            )
+            print(f"{limit:>6} {'orm':>8} {orm_time * 1000:>9.2f} ms {orm_peak / 1024:>9.1f} KiB")
+            print(f"{limit:>6} {'records':>8} {rec_time * 1000:>9.2f} ms {rec_peak / 1024:>9.1f} KiB")
+        db.close()
+
+if __name__ == "__main__":
+    main()
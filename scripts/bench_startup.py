@@ -0,0 +1,77 @@
+"""Import-time and cold-start benchmark for app.main.
+
+Each sample runs in a fresh interpreter so module caches don't hide regressions.
+
+    python scripts/bench_startup.py --runs 5 --max-import-ms 800 --max-cold-start-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import the app, run the lifespan startup and serve one request
+SNIPPET = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+import httpx
+
+async def serve_first_request():
+    application = app.main.app
+    async with application.router.lifespan_context(application):
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            (await client.get("/health")).raise_for_status()
+
+asyncio.run(serve_first_request())
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "cold_start_ms": (served - start) * 1000,
+    "openai_loaded": "openai" in sys.modules,
+}))
+"""
+
+def run_once(env):
+    result = subprocess.run(
+        [sys.executable, "-c", SNIPPET],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-cold-start-ms", type=float, default=None)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        env["PREWARM_ON_STARTUP"] = "false"
+        samples = [run_once(env) for _ in range(args.runs)]
+    
+    import_ms = statistics.median(s["import_ms"] for s in samples)
+    cold_start_ms = statistics.median(s["cold_start_ms"] for s in samples)
+    print(f"import app.main:  {import_ms:8.1f} ms (median of {args.runs})")
+    print(f"cold start:       {cold_start_ms:8.1f} ms (median of {args.runs})")
+    print(f"openai SDK loaded at startup: {any(s['openai_loaded'] for s in samples)}")
+    
+    failed = False
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"FAIL: import time exceeds {args.max_import_ms} ms")
+        failed = True
+    if args.max_cold_start_ms is not None and cold_start_ms > args.max_cold_start_ms:
+        print(f"FAIL: cold start exceeds {args.max_cold_start_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+from app.core import admission as admission_module
+from app.core.admission import AdaptiveLimit, AdmissionController, AdmissionRejected, LocalBuckets, is_overload
+from app.core.config import settings
+from app.providers.base import ProviderError
+import asyncio
+import pytest
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(admission_module, "time", clock)
+    return clock
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_SIZE", 10)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_WAIT", 5.0)
+    monkeypatch.setattr(settings, "ADMISSION_GLOBAL_TOKENS_PER_SEC", 0)
+    controller = AdmissionController(LocalBuckets())
+    controller.limiter.limit = 1.0
+    return controller
+
+def take(buckets, specs, max_wait=0.0):
+    return asyncio.run(buckets.take(specs, max_wait))
+
+def test_buckets_take_all_or_nothing(clock):
+    buckets = LocalBuckets()
+    assert take(buckets, [("b", 1.0, 1.0, 1)]) == (True, 0.0)
+    granted, wait = take(buckets, [("a", 1.0, 5.0, 1), ("b", 1.0, 1.0, 1)])
+    assert not granted
+    assert wait == pytest.approx(1.0)
+    assert buckets._level("a", 1.0, 5.0, clock.now) == 5.0
+
+def test_buckets_reserve_shortfall_within_max_wait(clock):
+    buckets = LocalBuckets()
+    take(buckets, [("a", 10.0, 10.0, 10)])
+    granted, wait = take(buckets, [("a", 10.0, 10.0, 5)], max_wait=1.0)
+    assert granted
+    assert wait == pytest.approx(0.5)
+    # The reservation leaves the bucket in debt, so the next caller waits behind it
+    granted, wait = take(buckets, [("a", 10.0, 10.0, 5)], max_wait=0.5)
+    assert not granted
+    assert wait == pytest.approx(1.0)
+
+def test_buckets_refill_up_to_capacity(clock):
+    buckets = LocalBuckets()
+    take(buckets, [("a", 2.0, 4.0, 4)])
+    clock.now += 1.0
+    assert buckets._level("a", 2.0, 4.0, clock.now) == pytest.approx(2.0)
+    clock.now += 60.0
+    assert buckets._level("a", 2.0, 4.0, clock.now) == 4.0
+
+def test_buckets_prune_refilled(clock, monkeypatch):
+    monkeypatch.setattr(admission_module, "MAX_LOCAL_BUCKETS", 2)
+    buckets = LocalBuckets()
+    take(buckets, [("a", 1.0, 1.0, 1)])
+    take(buckets, [("b", 1.0, 1.0, 1)])
+    clock.now += 1.0
+    take(buckets, [("c", 1.0, 1.0, 1)])
+    assert set(buckets._buckets) == {"c"}
+
+def test_limit_grows_only_when_saturated(clock):
+    limiter = AdaptiveLimit(minimum=2, maximum=4, initial=2, tolerance=2.0)
+    limiter.observe(0.1, in_flight=0)
+    assert limiter.limit == 2.0
+    limiter.observe(0.1, in_flight=1)
+    assert limiter.limit == pytest.approx(2.5)
+    for _ in range(20):
+        limiter.observe(0.1, in_flight=10)
+    assert limiter.limit == 4.0
+
+def test_limit_shrinks_on_failure_once_per_round_trip(clock):
+    limiter = AdaptiveLimit(minimum=2, maximum=64, initial=20, tolerance=2.0)
+    limiter.observe(1.0, in_flight=0)
+    limiter.observe(1.0, in_flight=0, ok=False)
+    assert limiter.limit == pytest.approx(18.0)
+    limiter.observe(1.0, in_flight=0, ok=False)
+    assert limiter.limit == pytest.approx(18.0)
+    clock.now += 1.0
+    limiter.observe(1.0, in_flight=0, ok=False)
+    assert limiter.limit == pytest.approx(16.2)
+
+def test_limit_shrinks_on_latency_rise(clock):
+    limiter = AdaptiveLimit(minimum=2, maximum=64, initial=10, tolerance=2.0)
+    limiter.observe(0.1, in_flight=0)
+    clock.now += 10.0
+    limiter.observe(5.0, in_flight=9)
+    assert limiter.limit == pytest.approx(9.0)
+
+def test_limit_baseline_drifts_up(clock):
+    limiter = AdaptiveLimit(minimum=2, maximum=64, initial=10, tolerance=2.0)
+    limiter.observe(0.1, in_flight=0)
+    limiter.observe(1.1, in_flight=0)
+    assert limiter.baseline == pytest.approx(0.11)
+    limiter.observe(0.05, in_flight=0)
+    assert limiter.baseline == 0.05
+
+def test_expected_wait_scales_with_queue(clock):
+    limiter = AdaptiveLimit(minimum=2, maximum=64, initial=4, tolerance=2.0)
+    assert limiter.expected_wait(0) == pytest.approx(0.25)
+    limiter.observe(2.0, in_flight=0)
+    assert limiter.expected_wait(3) == pytest.approx(2.0)
+
+def test_release_hands_slots_over_in_order(controller):
+    async def scenario():
+        await controller._acquire(controller.deadline())
+        order = []
+
+        async def wait(name):
+            await controller._acquire(controller.deadline())
+            order.append(name)
+
+        tasks = [asyncio.create_task(wait(name)) for name in ("first", "second")]
+        await asyncio.sleep(0)
+        assert len(controller._waiters) == 2
+        controller._release()
+        await asyncio.sleep(0.01)
+        assert order == ["first"]
+        assert controller.in_flight == 1
+        controller._release()
+        await asyncio.gather(*tasks)
+        assert order == ["first", "second"]
+        controller._release()
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
+
+def test_queue_full_rejects(controller, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_SIZE", 0)
+
+    async def scenario():
+        await controller._acquire(controller.deadline())
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller._acquire(controller.deadline())
+        assert rejected.value.reason == "queue_full"
+        assert controller.in_flight == 1
+
+    asyncio.run(scenario())
+
+def test_deadline_rejects_with_queue_estimate(controller):
+    controller.limiter.smoothed = 10.0
+
+    async def scenario():
+        await controller._acquire(controller.deadline())
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller._acquire(controller.deadline())
+        assert rejected.value.reason == "deadline"
+        assert rejected.value.retry_after == pytest.approx(10.0)
+
+    asyncio.run(scenario())
+
+def test_deadline_spent_before_queue_hints_time_spent(controller):
+    controller.limiter.smoothed = 0.3
+
+    async def scenario():
+        await controller._acquire(controller.deadline())
+        # Context assembly already used 4.9s of the 5s budget
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller._acquire(controller.deadline() - 4.9)
+        assert rejected.value.reason == "budget_spent"
+        assert rejected.value.retry_after == pytest.approx(4.9, abs=0.05)
+
+    asyncio.run(scenario())
+
+def test_timeout_while_queued_removes_waiter(controller):
+    controller.limiter.smoothed = 0.01
+
+    async def scenario():
+        await controller._acquire(controller.deadline())
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller._acquire(controller.deadline() - 4.95)
+        assert rejected.value.reason == "deadline"
+        assert rejected.value.retry_after >= 0.04
+        assert not controller._waiters
+        assert controller.in_flight == 1
+
+    asyncio.run(scenario())
+
+def test_cancel_while_queued_removes_waiter(controller):
+    async def scenario():
+        await controller._acquire(controller.deadline())
+        task = asyncio.create_task(controller._acquire(controller.deadline()))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not controller._waiters
+        controller._release()
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
+
+def test_cancel_after_handoff_does_not_leak_slot(controller):
+    async def scenario():
+        await controller._acquire(controller.deadline())
+        task = asyncio.create_task(controller._acquire(controller.deadline()))
+        await asyncio.sleep(0)
+        # The slot is handed over, but the caller goes away before it resumes
+        controller._release()
+        assert controller.in_flight == 1
+        task.cancel()
+        try:
+            await task
+            owned = True
+        except asyncio.CancelledError:
+            owned = False
+        # Either the caller still got the slot and will release it, or it was given back
+        assert controller.in_flight == (1 if owned else 0)
+
+    asyncio.run(scenario())
+
+def test_queue_rejection_takes_no_tokens(controller, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_SIZE", 0)
+    monkeypatch.setattr(settings, "ADMISSION_GLOBAL_TOKENS_PER_SEC", 100.0)
+    monkeypatch.setattr(settings, "ADMISSION_GLOBAL_TOKEN_BURST", 1000.0)
+
+    async def scenario():
+        async with controller.provider_slot(100, controller.deadline()):
+            with pytest.raises(AdmissionRejected):
+                async with controller.provider_slot(500, controller.deadline()):
+                    pass
+        granted, _ = await controller.buckets.take([("global:tokens", 100.0, 1000.0, 900)], 0.0)
+        assert granted
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
+
+def test_token_rejection_releases_slot(controller, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_GLOBAL_TOKENS_PER_SEC", 1.0)
+    monkeypatch.setattr(settings, "ADMISSION_GLOBAL_TOKEN_BURST", 1000.0)
+
+    async def scenario():
+        await controller.buckets.take([("global:tokens", 1.0, 1000.0, 1000)], 0.0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.provider_slot(100, controller.deadline()):
+                pass
+        assert rejected.value.reason == "token_budget"
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
+
+def test_admit_paces_when_allowed_to_wait(controller, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_USER_RPS", 20.0)
+    monkeypatch.setattr(settings, "ADMISSION_USER_BURST", 1)
+    monkeypatch.setattr(settings, "ADMISSION_GLOBAL_RPS", 0)
+
+    async def scenario():
+        await controller.admit("u1")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.admit("u1")
+        assert rejected.value.reason == "rate_limit"
+        await controller.admit("u1", max_wait=1.0)
+
+    asyncio.run(scenario())
+
+@pytest.mark.parametrize("error, overloaded", [
+    (ProviderError("bad model", status_code=404), False),
+    (ProviderError("bad max_tokens", status_code=400), False),
+    (ProviderError("no status"), False),
+    (ValueError("unsupported provider"), False),
+    (ProviderError("rate limited", status_code=429), True),
+    (ProviderError("unavailable", status_code=503), True),
+    (ProviderError("slow", timed_out=True), True),
+    (asyncio.TimeoutError(), True),
+])
+def test_is_overload(error, overloaded):
+    assert is_overload(error) is overloaded
+
+def fail_in_slot(controller, error):
+    async def scenario():
+        with pytest.raises(type(error)):
+            async with controller.provider_slot(0, controller.deadline()):
+                raise error
+
+    asyncio.run(scenario())
+
+def test_client_errors_leave_the_limit_alone(controller):
+    controller.limiter.limit = 16.0
+    for _ in range(5):
+        fail_in_slot(controller, ProviderError("bad model", status_code=404))
+    assert controller.limiter.limit == 16.0
+    assert controller.limiter.smoothed is None
+    assert controller.in_flight == 0
+
+def test_overload_errors_shrink_the_limit(controller):
+    controller.limiter.limit = 16.0
+    fail_in_slot(controller, ProviderError("unavailable", status_code=503))
+    assert controller.limiter.limit == pytest.approx(14.4)
+    assert controller.in_flight == 0
+
+def test_cancelled_caller_is_not_observed(controller):
+    async def scenario():
+        async def call():
+            async with controller.provider_slot(0, controller.deadline()):
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(call())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert controller.limiter.smoothed is None
+    assert controller.in_flight == 0
+
+def test_streams_observe_time_to_first_token(controller):
+    async def scenario():
+        async with controller.provider_slot(0, controller.deadline()) as slot:
+            await asyncio.sleep(0.01)
+            slot.first_token()
+            # A slow reader holds the stream open well past the first token
+            await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    assert controller.limiter.smoothed < 0.1
@@ -0,0 +1,42 @@
+from app.memory.facts import extract_facts, query_keys
+import pytest
+
+def facts_of(message):
+    return {key: value for key, value, kind in extract_facts(message) if kind == "fact"}
+
+def test_value_stops_at_new_clause():
+    assert facts_of("I live in Paris and I work at Google.") == {"location": "Paris", "employer": "Google"}
+
+def test_value_stops_at_but():
+    assert facts_of("I work at a startup but my boss is Tom.") == {"employer": "a startup"}
+
+def test_value_stops_at_comma_and_pronoun():
+    assert facts_of("My city is Lyon, it's lovely") == {"location": "Lyon"}
+    assert facts_of("I work as a data engineer, and I love it") == {"occupation": "data engineer"}
+
+@pytest.mark.parametrize("message", [
+    "my question is how do I deploy this",
+    "my code is broken again",
+    "My boss is Tom",
+])
+def test_generic_pattern_ignores_non_attribute_keys(message):
+    assert facts_of(message) == {}
+
+def test_conjunctions_inside_a_value_are_kept():
+    assert facts_of("My name is Sam and my tech stack is FastAPI and Postgres.") == {
+        "name": "Sam",
+        "stack": "FastAPI and Postgres",
+    }
+    assert facts_of("I work at Procter and Gamble") == {"employer": "Procter and Gamble"}
+
+def test_generic_attribute_keys_and_aliases():
+    assert facts_of("My favorite color is blue") == {"favorite_color": "blue"}
+    assert facts_of("My hometown is Porto") == {"location": "Porto"}
+
+def test_later_mention_wins():
+    assert facts_of("My name is Sam. Actually call me Samantha.") == {"name": "Samantha"}
+
+def test_query_keys_include_hinted_facts():
+    keys = query_keys("where do I live?")
+    assert "location" in keys
+    assert "name" in keys
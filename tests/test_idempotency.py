@@ -0,0 +1,160 @@
+from app.core import idempotency as idempotency_module
+from app.core.config import settings
+from app.core.idempotency import (
+    IdempotencyConflict, IdempotencyKeyReused, IdempotencyManager, MemoryIdempotencyStore
+)
+import asyncio
+import pytest
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_TTL", 60.0)
+    monkeypatch.setattr(settings, "IDEMPOTENCY_LOCK_TTL", 5.0)
+    monkeypatch.setattr(idempotency_module, "POLL_INTERVAL", 0.01)
+    return IdempotencyManager(MemoryIdempotencyStore(max_entries=100))
+
+class Work:
+    """Counts calls; blocks on `release` when given one, and fails while `error` is set."""
+
+    def __init__(self, response="ok", release=None, error=None):
+        self.calls = 0
+        self.response = response
+        self.release = release
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {"message": self.response, "call": self.calls}
+
+def test_retry_is_replayed(manager):
+    work = Work()
+
+    async def scenario():
+        first = await manager.run("k", "fp", work)
+        second = await manager.run("k", "fp", work)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == ({"message": "ok", "call": 1}, False)
+    assert second == ({"message": "ok", "call": 1}, True)
+    assert work.calls == 1
+    assert manager.stats == {"executed": 1, "coalesced": 0, "replayed": 1}
+
+def test_concurrent_duplicates_coalesce(manager):
+    async def scenario():
+        work = Work(release=asyncio.Event())
+        runs = [asyncio.create_task(manager.run("k", "fp", work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        work.release.set()
+        return work, await asyncio.gather(*runs)
+
+    work, results = asyncio.run(scenario())
+    assert work.calls == 1
+    assert [replayed for _, replayed in results] == [False, True, True]
+    assert all(body == results[0][0] for body, _ in results)
+    assert manager.stats["coalesced"] == 2
+
+def test_cancelled_caller_does_not_cancel_shared_work(manager):
+    async def scenario():
+        work = Work(release=asyncio.Event())
+        first = asyncio.create_task(manager.run("k", "fp", work))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(manager.run("k", "fp", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        work.release.set()
+        return work, await second
+
+    work, (body, replayed) = asyncio.run(scenario())
+    assert work.calls == 1
+    assert body["call"] == 1
+    assert replayed
+
+def test_reused_key_with_different_body_is_rejected(manager):
+    async def scenario():
+        work = Work(release=asyncio.Event())
+        running = asyncio.create_task(manager.run("k", "fp-1", work))
+        await asyncio.sleep(0.01)
+        with pytest.raises(IdempotencyKeyReused):
+            await manager.run("k", "fp-2", work)
+        work.release.set()
+        await running
+        # Still rejected once the first response is stored
+        with pytest.raises(IdempotencyKeyReused):
+            await manager.run("k", "fp-2", work)
+        return work
+
+    assert asyncio.run(scenario()).calls == 1
+
+def test_failure_is_not_stored(manager):
+    work = Work(error=RuntimeError("provider down"))
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await manager.run("k", "fp", work)
+        work.error = None
+        return await manager.run("k", "fp", work)
+
+    body, replayed = asyncio.run(scenario())
+    assert (body["call"], replayed) == (2, False)
+    assert manager.stats["executed"] == 1
+
+def test_waits_for_claim_held_by_another_process(manager):
+    store = manager.store
+    work = Work()
+
+    async def scenario():
+        assert await store.claim("k", 5.0)
+        running = asyncio.create_task(manager.run("k", "fp", work))
+        await asyncio.sleep(0.05)
+        assert not running.done()
+        await store.put("k", {"fingerprint": "fp", "response": {"message": "elsewhere"}}, 60.0)
+        return await running
+
+    assert asyncio.run(scenario()) == ({"message": "elsewhere"}, True)
+    assert work.calls == 0
+
+def test_claim_held_past_lock_ttl_conflicts(manager, monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_LOCK_TTL", 0.05)
+
+    async def scenario():
+        await manager.store.claim("k", 60.0)
+        with pytest.raises(IdempotencyConflict):
+            await manager.run("k", "fp", Work())
+
+    asyncio.run(scenario())
+
+def test_unavailable_store_runs_unguarded(manager):
+    class BrokenStore:
+        async def get(self, key):
+            raise ConnectionError("redis down")
+
+    manager = IdempotencyManager(BrokenStore())
+    work = Work()
+    assert asyncio.run(manager.run("k", "fp", work)) == ({"message": "ok", "call": 1}, False)
+
+def test_memory_store_expires_and_caps_entries(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(idempotency_module, "time", clock)
+    store = MemoryIdempotencyStore(max_entries=2)
+
+    async def scenario():
+        for key in ("a", "b", "c"):
+            await store.put(key, {"key": key}, 10.0)
+        assert await store.get("a") is None
+        assert await store.get("c") == {"key": "c"}
+        clock.now += 11.0
+        assert await store.get("c") is None
+
+    asyncio.run(scenario())
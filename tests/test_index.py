@@ -0,0 +1,52 @@
+from app.memory.index import MemoryIndex, Segment, index_key, write_segment
+from array import array
+from datetime import datetime
+import os
+import uuid
+
+WATERMARK = datetime(2024, 1, 15, 10, 30, 0)
+
+def make_segment(path, docs, terms):
+    write_segment(path, 0, WATERMARK, docs, {index_key("u1", term): array("I", ids) for term, ids in terms.items()})
+    return Segment(path)
+
+def test_segment_round_trip(tmp_path):
+    docs = [(uuid.uuid4().bytes, 1700000000.0 + i) for i in range(3)]
+    terms = {"python": [0, 2], "rust": [1], "zebra": [0, 1, 2]}
+    segment = make_segment(str(tmp_path / "shard-0000.seg"), docs, terms)
+
+    assert segment.shard == 0
+    assert segment.watermark == WATERMARK
+    assert (segment.n_docs, segment.n_terms) == (3, 3)
+    assert [segment.doc(i) for i in range(3)] == docs
+    for term, ids in terms.items():
+        assert list(segment.postings(index_key("u1", term))) == ids
+    assert list(segment.postings(index_key("u1", "missing"))) == []
+    assert list(segment.postings(index_key("u2", "python"))) == []
+    assert [(key, list(ids)) for key, ids in segment.iter_terms()] == [
+        (index_key("u1", term), ids) for term, ids in sorted(terms.items())
+    ]
+
+def test_empty_segment_round_trip(tmp_path):
+    segment = make_segment(str(tmp_path / "shard-0000.seg"), [], {})
+    assert (segment.n_docs, segment.n_terms) == (0, 0)
+    assert list(segment.postings(index_key("u1", "python"))) == []
+
+def test_write_segment_replaces_atomically(tmp_path):
+    path = str(tmp_path / "shard-0000.seg")
+    make_segment(path, [(uuid.uuid4().bytes, 1.0)], {"python": [0]})
+    segment = make_segment(path, [(uuid.uuid4().bytes, 2.0)], {"rust": [0]})
+    assert list(segment.postings(index_key("u1", "python"))) == []
+    assert os.listdir(tmp_path) == ["shard-0000.seg"]
+
+def test_replayed_rows_mask_their_snapshot_terms(tmp_path):
+    index = MemoryIndex(str(tmp_path), 1)
+    edited, untouched = uuid.uuid4(), uuid.uuid4()
+    docs = [(edited.bytes, 1700000000.0), (untouched.bytes, 1700000001.0)]
+    index.segments[0] = make_segment(index._path(0), docs, {"python": [0, 1]})
+    # The edited memory no longer mentions python
+    index.overlays[0].add(edited.bytes, 1700000000.0, datetime.utcnow(), {index_key("u1", "rust")})
+    index.ready = True
+
+    assert index.search("u1", "python") == [untouched]
+    assert index.search("u1", "rust") == [edited]
@@ -0,0 +1,73 @@
+from app.core import usage as usage_module
+from app.core.database import Base
+from app.core.usage import rebuild_usage_rollups, record_usage
+from app.models.chat import ChatMessage
+from app.models.usage import UsageRollup
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+import pytest
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[ChatMessage.__table__, UsageRollup.__table__])
+    session = Session(bind=engine)
+    yield session
+    session.close()
+    engine.dispose()
+
+def turn(user_id, day, provider="openai", model="gpt-4", prompt=10, completion=5, estimated=False):
+    timestamp = datetime(2024, 1, day, 12, 0, 0)
+    return [
+        ChatMessage(user_id=user_id, role="user", content="hi", tokens_used=prompt, timestamp=timestamp,
+                    provider=provider, model=model),
+        ChatMessage(user_id=user_id, role="assistant", content="hello", prompt_tokens=prompt,
+                    completion_tokens=completion, tokens_used=prompt + completion, tokens_estimated=estimated,
+                    timestamp=timestamp, provider=provider, model=model),
+    ]
+
+def rollups(db):
+    return sorted(
+        (row.user_id, row.day, row.provider, row.model, row.requests, row.prompt_tokens, row.completion_tokens,
+         row.total_tokens, row.estimated_requests, row.estimated_tokens)
+        for row in db.query(UsageRollup).all()
+    )
+
+def batches():
+    return [
+        turn("u1", 15) + turn("u1", 15, prompt=20, completion=7) + turn("u2", 15, provider="anthropic", model="claude"),
+        turn("u1", 15, estimated=True) + turn("u1", 16),
+        turn("u1", 15, prompt=3, completion=4) + turn("u2", 16, provider=None, model=None) + turn("u2", 15, provider="anthropic", model="claude", estimated=True),
+    ]
+
+@pytest.mark.parametrize("upsert", [True, False], ids=["upsert", "portable"])
+def test_recorded_rollups_match_rebuild(db, monkeypatch, upsert):
+    if not upsert:
+        monkeypatch.setattr(usage_module, "dialect_insert", lambda db, model: None)
+    for messages in batches():
+        db.add_all(messages)
+        record_usage(db, messages)
+        db.commit()
+    recorded = rollups(db)
+
+    assert rebuild_usage_rollups(db) == len(recorded)
+    assert rollups(db) == recorded
+
+    by_key = {row[:4]: row[4:] for row in recorded}
+    assert by_key[("u1", datetime(2024, 1, 15).date(), "openai", "gpt-4")] == (3, 33, 16, 49, 1, 15)
+    assert by_key[("u2", datetime(2024, 1, 16).date(), "unknown", "unknown")] == (1, 10, 5, 15, 0, 0)
+
+def test_rebuild_one_user_leaves_others(db):
+    for messages in batches():
+        db.add_all(messages)
+        record_usage(db, messages)
+        db.commit()
+    recorded = rollups(db)
+
+    db.query(UsageRollup).update({"requests": 0})
+    db.commit()
+    rebuild_usage_rollups(db, user_id="u1")
+    assert [row for row in rollups(db) if row[0] == "u1"] == [row for row in recorded if row[0] == "u1"]
+    assert all(row[4] == 0 for row in rollups(db) if row[0] == "u2")